@@ -11,6 +11,9 @@ from torch.distributions import MultivariateNormal
 from pytorch_msssim import SSIM
 from ImageManager import ImageManager
 from GaussianParam import GaussianParamsList
+from SnapRecorder import SnapRecorder
+from SpatialIndex import SpatialIndex
+from LevelOfDetail import LevelOfDetail
 
 class GaussianSplatting2D():
     """2DGSによる画像近似"""
@@ -20,20 +23,31 @@ class GaussianSplatting2D():
     _RAND_SEED:int = 0           # デフォルト値：乱数シード
     _NUM_STEPS:int = 10000       # デフォルト値：学習ステップ数
     _LEARNING_RATE:float = 0.01  # デフォルト値：学習率
+    _FINAL_LR_RATIO:float = 0.1  # デフォルト値：学習率スケジュールの最終倍率
+    _LR_SCHEDULES = ("constant", "linear", "cosine", "exponential")
+    _OPTIMIZER_IMPLS = ("auto", "fused", "foreach", "for-loop")
+    _MIN_VARIANCE:float = 1e-4     # 分散の下限（sigmaが0に近づいても共分散行列を正定値に保つ）
+    _MAX_CORRELATION:float = 0.99  # 相関係数の絶対値の上限
 
-    def __init__(self, save_dir:str=None):
+    def __init__(self, save_dir:str=None, device:str=None):
         """
         コンストラクタ
         save_dir: 保存先の親ディレクトリ
+        device: 計算に使うデバイス（Noneなら利用可能なGPU、なければCPU）
         """
         self.num_gaussians = 0
         self.img_org = None         # オリジナル画像(pil image, リサイズ後)
         self.img_array = None       # GT画像
         self.pos_for_kernel = None  # ガウシアンカーネル計算用の座標配列
         self.params = None          # ガウシアンパラメタ
-        self.device = self.get_processer()
+        self.optimizer = None       # 最後に使ったオプティマイザ（ウォームスタート用）
+        self.spatial_index = None   # ガウシアンの空間インデックス（参照時に更新）
+        self._index_params = None   # 空間インデックス作成時のパラメタ
+        self._index_dirty = True    # パラメタ更新後、空間インデックスが未更新か
+        self.device = torch.device(device) if device is not None else self.get_processer()
         self.save_dir = self._get_save_dir(save_dir)
         self.should_stop = False
+        self.recorder = None        # 録画用（学習中のみ有効）
         self.ssim_module = SSIM(data_range=1.0, size_average=True, channel=1).to(self.device)
         print(f"device: {self.device}")
         print(f"save_dir: {self.save_dir}")
@@ -61,7 +75,18 @@ class GaussianSplatting2D():
         self.img_array = torch.tensor(np_img, dtype=torch.float32, device=self.device)
         self.create_gaussian_params(num_gaussians)
 
-    def get_processer(self) -> torch.device:
+    def set_target_image(self, input_image:Image):
+        """
+        ガウシアンパラメタを保持したまま学習対象の画像を差し替える（連続フレームのウォームスタート用）
+        input_image: 入力画像。現在の画像サイズにリサイズされる
+        """
+        resize_w, resize_h = self.img_org.size
+        self.img_org = input_image.convert('L').resize((resize_w, resize_h))
+        np_img = np.array(self.img_org).astype(np.float32) / 255.0
+        self.img_array = torch.tensor(np_img, dtype=torch.float32, device=self.device)
+
+    @staticmethod
+    def get_processer() -> torch.device:
         """利用可能なプロセッサー(CPU/GPU)を取得"""
         device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         return device
@@ -105,18 +130,19 @@ class GaussianSplatting2D():
         num_gaussians: ガウシアン点数
         """
         self.num_gaussians = num_gaussians
-        torch.manual_seed(GaussianSplatting2D._RAND_SEED)
+        # 並行する他の処理とグローバルの乱数を共有しないよう、専用の乱数生成器を使う
+        generator = torch.Generator(device=self.device).manual_seed(GaussianSplatting2D._RAND_SEED)
         height, width = self.img_array.shape
 
         # ガウシアンパラメタの初期化（位置x,y、分散共分散s_x, s_y, s_xy、重みw）
         self.params = nn.ParameterDict({
-            'means': nn.Parameter(torch.rand(num_gaussians, 2, dtype=torch.float32, device=self.device) * \
+            'means': nn.Parameter(torch.rand(num_gaussians, 2, dtype=torch.float32, device=self.device, generator=generator) * \
                                   torch.tensor([width, height], dtype=torch.float32, device=self.device)),
-            'sigmas': (torch.cat([
+            'sigmas': nn.Parameter(torch.cat([
                 torch.ones(num_gaussians, 2, dtype=torch.float32, device = self.device) * 5.0,
                 torch.zeros(num_gaussians, 1, dtype=torch.float32, device = self.device)
             ], dim=1)),
-            'weights': nn.Parameter(torch.rand(num_gaussians, dtype=torch.float32, device=self.device) * 0.5 + 0.5)
+            'weights': nn.Parameter(torch.rand(num_gaussians, dtype=torch.float32, device=self.device, generator=generator) * 0.5 + 0.5)
         })
 
         # 計算用座標配列も初期化
@@ -138,6 +164,51 @@ class GaussianSplatting2D():
             self.params['sigmas'].data[idx, 2] = param.sigma_xy
             self.params['weights'].data[idx] = param.weight
 
+    def get_params_numpy(self) -> dict:
+        """
+        ガウシアンパラメタをnumpy配列で取得
+        return: {'means': (N, 2), 'sigmas': (N, 3) or (N, 2), 'weights': (N,)}
+        """
+        return {key: value.detach().cpu().numpy() for key, value in self.params.items()}
+
+    def set_params_numpy(self, params:dict):
+        """
+        ガウシアンパラメタをnumpy配列から一括設定
+        params: get_params_numpy()と同じ形式のdict
+        """
+        self.create_gaussian_params(len(params['weights']))
+        for key, value in params.items():
+            self.params[key].data.copy_(torch.as_tensor(value, dtype=torch.float32, device=self.device))
+
+    def render_params_numpy(self, params:dict) -> np.ndarray:
+        """
+        指定したパラメタで予測画像を生成（現在のパラメタは変更しない）
+        params: get_params_numpy()と同じ形式のdict
+        return: 0.0〜1.0のfloat画像 (H, W)
+        """
+        tensors = {key: torch.as_tensor(value, dtype=torch.float32, device=self.device)
+                   for key, value in params.items()}
+        with torch.no_grad():
+            img_pred = self._generate_predicted_image(tensors)
+        return img_pred.cpu().numpy()
+
+    def get_spatial_index(self) -> SpatialIndex:
+        """
+        空間インデックスを取得
+        note: 学習ステップや編集のたびには更新せず、参照時に変更があったガウシアンだけを更新する
+        return: 現在のパラメタに対応した空間インデックス
+        """
+        height, width = self.img_array.shape
+        index = self.spatial_index
+        if index is None or (index.width, index.height) != (width, height):
+            index = self.spatial_index = SpatialIndex(width, height)
+            self._index_dirty = True
+        if self._index_dirty or self._index_params is not self.params:
+            index.refresh(self.get_params_numpy())
+            self._index_params = self.params
+            self._index_dirty = False
+        return index
+
     def _gaussian_2d_batch(self, means:torch.nn.parameter.Parameter, sigmas:torch.nn.parameter.Parameter) -> torch.Tensor:
         """
         ガウシアンを一括計算（共分散あり）
@@ -145,14 +216,19 @@ class GaussianSplatting2D():
         sigmas: 分散共分散行列要素 (N, 3) [sigma_x_sq, sigma_y_sq, sigma_xy]
         return: (N, H, W) - ガウシアンを描画した画像N枚
         """
-        num_gaussians = self.num_gaussians
+        num_gaussians = means.shape[0]
         height, width = self.img_array.shape[1], self.img_array.shape[0]
+        pos_for_kernel = self.pos_for_kernel
+        if pos_for_kernel.shape[1] != num_gaussians:
+            # 一部のガウシアンだけ描画する場合
+            pos_for_kernel = pos_for_kernel[:, :1, :].expand(-1, num_gaussians, -1)
 
-        # 分散共分散行列の正定値性の保証 (C_xy < sqrt(sigma_x^2 * sigma_y^2)
-        sigma_x_sq = sigmas[:, 0].square() #.data.clamp(min:=0.0)
-        sigma_y_sq = sigmas[:, 1].square() #.data.clamp(min:=0.0)
+        # 分散共分散行列の正定値性の保証
+        # 分散に下限を足し、|C_xy| <= r * sqrt(sigma_x^2 * sigma_y^2) (r < 1) に制限する（sigmaがいくつでも正定値）
+        sigma_x_sq = sigmas[:, 0].square() + GaussianSplatting2D._MIN_VARIANCE
+        sigma_y_sq = sigmas[:, 1].square() + GaussianSplatting2D._MIN_VARIANCE
         sigma_xy = sigmas[:, 2]
-        threshold = (sigma_x_sq * sigma_y_sq).sqrt() - 1e-3
+        threshold = GaussianSplatting2D._MAX_CORRELATION * (sigma_x_sq * sigma_y_sq).sqrt()
         sigma_xy = torch.min(torch.max(sigma_xy, -threshold), threshold)
 
         # 分散共分散行列を作成 (N, 2, 2)
@@ -165,17 +241,29 @@ class GaussianSplatting2D():
         
         # ガウシアン計算
         m = MultivariateNormal(loc=means, covariance_matrix=cov_matrices)
-        log_gaussians = m.log_prob(self.pos_for_kernel)     # (N, H*W)
+        log_gaussians = m.log_prob(pos_for_kernel)          # (N, H*W)
         gaussians = torch.exp(log_gaussians.permute(1, 0))  # (N, H*W)
         gaussians = gaussians.view(num_gaussians, width, height)
 
         return gaussians
 
-    def _generate_predicted_image(self):
-        """予測画像を生成"""
-        gaussian_pred = self._gaussian_2d_batch(self.params['means'], self.params['sigmas'])
-        img_pred = self.params['weights'][:, None, None] * gaussian_pred
+    def _generate_unnormalized_image(self, params:dict=None) -> torch.Tensor:
+        """
+        正規化前の予測画像（重み付きガウシアンの総和）を生成
+        params: 描画するパラメタ（Noneなら現在のパラメタ）
+        """
+        params = self.params if params is None else params
+        gaussian_pred = self._gaussian_2d_batch(params['means'], params['sigmas'])
+        img_pred = params['weights'][:, None, None] * gaussian_pred
         img_pred = torch.sum(img_pred, dim=0)
+        return img_pred
+
+    def _generate_predicted_image(self, params:dict=None):
+        """
+        予測画像を生成
+        params: 描画するパラメタ（Noneなら現在のパラメタ）
+        """
+        img_pred = self._generate_unnormalized_image(params)
         img_pred = img_pred / img_pred.max()
         img_pred = torch.clamp(img_pred, min:=0, max:=1)        
         return img_pred
@@ -211,21 +299,36 @@ class GaussianSplatting2D():
             )
         return output_image
 
-    def generate_current_images(self) -> dict:
+    def get_contribution_order(self) -> np.ndarray:
+        """
+        画像への寄与度の大きい順にガウシアンを並べる
+        return: (N,) のインデックス（寄与度の降順）
+        """
+        height, width = self.img_array.shape
+        return LevelOfDetail.rank(self.get_params_numpy(), width, height)
+
+    def generate_current_images(self, top_k:int=None) -> dict:
         """
         現在のパラメタ値から推論画像を生成
+        top_k: 指定した場合、寄与度の大きい上位k個のガウシアンだけで描画する（プレビュー用）
         return:
         推論画像をdict型で返す。
         1. 推論画像
         2. ガウシアン中心点をプロット付きの推論画像
         """
+        params = None
+        if top_k is not None and 0 < top_k < self.num_gaussians:
+            indices = torch.as_tensor(self.get_contribution_order()[:top_k], device=self.device)
+            params = {key: value.detach()[indices] for key, value in self.params.items()}
+
         # 予測画像生成
-        img_pred = self._generate_predicted_image()
+        with torch.no_grad():
+            img_pred = self._generate_predicted_image(params)
         img_pred_np = img_pred.cpu().detach().numpy()
         img_pred_np = np.clip(img_pred_np, 0, 1)
 
         # ポイント描画画像生成
-        points = self.params["means"].cpu().detach().numpy()
+        points = (self.params if params is None else params)["means"].cpu().detach().numpy()
         img_with_points = self._generate_gaussian_points_image(img_pred_np, points)
 
         return {
@@ -258,70 +361,266 @@ class GaussianSplatting2D():
         loss = F.mse_loss(img_pred, img_gt)
         return loss
 
+    def _build_param_groups(self, opt_lr:float, param_groups:dict=None) -> list:
+        """
+        パラメタの種類ごとのグループを作成
+        opt_lr: 既定の学習率
+        param_groups: パラメタ名('means', 'sigmas', 'weights')ごとの設定。未指定の項目は既定値
+                      {'lr': 学習率, 'schedule': 学習率スケジュール, 'final_ratio': 最終ステップでの学習率の倍率}
+        return: オプティマイザに渡すパラメタグループのリスト
+        """
+        param_groups = param_groups or {}
+        unknown = set(param_groups) - set(self.params.keys())
+        if unknown:
+            raise ValueError(f"存在しないパラメタ名です: {sorted(unknown)}")
+
+        groups = []
+        for name, param in self.params.items():
+            config = param_groups.get(name, {})
+            if not isinstance(config, dict):
+                raise ValueError(f"パラメタグループの設定はdictで指定してください: {name}={config}")
+            schedule = config.get('schedule', "constant")
+            if schedule not in GaussianSplatting2D._LR_SCHEDULES:
+                raise ValueError(f"サポートされていない学習率スケジュール: {schedule}")
+            try:
+                lr = float(config.get('lr', opt_lr))
+                final_ratio = float(config.get('final_ratio', GaussianSplatting2D._FINAL_LR_RATIO))
+            except (TypeError, ValueError):
+                raise ValueError(f"学習率の設定が数値ではありません: {name}={config}")
+            if not lr > 0:
+                raise ValueError(f"学習率は正の値を指定してください: {name}: lr={lr}")
+            if not 0 < final_ratio <= 1:
+                raise ValueError(f"final_ratioは0より大きく1以下を指定してください: {name}: final_ratio={final_ratio}")
+            groups.append({
+                'params': [param],
+                'name': name,
+                'lr': lr,
+                'base_lr': lr,
+                'schedule': schedule,
+                'final_ratio': final_ratio
+            })
+        return groups
+
+    def _get_optimizer(self, opt_lr:float, reuse_optimizer:bool=False, param_groups:dict=None,
+                       optimizer_impl:str="auto") -> optim.Optimizer:
+        """
+        オプティマイザを取得
+        opt_lr: 既定の学習率
+        reuse_optimizer: Trueなら前回の学習のオプティマイザ（モーメント）を引き継ぐ
+        param_groups: パラメタ名ごとの学習率設定（_build_param_groupsを参照）
+        optimizer_impl: Adamの実装 ("auto": GPUならfused、CPUならforeach / "fused" / "foreach" / "for-loop")
+        return: オプティマイザ
+        """
+        if optimizer_impl not in GaussianSplatting2D._OPTIMIZER_IMPLS:
+            raise ValueError(f"サポートされていないオプティマイザの実装: {optimizer_impl}")
+        groups = self._build_param_groups(opt_lr, param_groups)
+        params = [p for group in groups for p in group['params']]
+        if reuse_optimizer and self.optimizer is not None:
+            # パラメタが作り直されていなければ、学習率設定だけ差し替えて再利用
+            prev_params = [p for group in self.optimizer.param_groups for p in group['params']]
+            if len(prev_params) == len(params) and all(p is q for p, q in zip(prev_params, params)):
+                for prev_group, group in zip(self.optimizer.param_groups, groups):
+                    prev_group.update({key: value for key, value in group.items() if key != 'params'})
+                return self.optimizer
+
+        if optimizer_impl == "auto":
+            optimizer_impl = "fused" if self.device.type == 'cuda' else "foreach"
+        if optimizer_impl == "fused":
+            self.optimizer = optim.Adam(groups, lr=opt_lr, fused=True)
+        else:
+            self.optimizer = optim.Adam(groups, lr=opt_lr, foreach=(optimizer_impl == "foreach"))
+        return self.optimizer
+
+    @staticmethod
+    def _update_lr(optimizer:optim.Optimizer, step:int, num_steps:int):
+        """
+        学習率スケジュールに従い、グループごとの学習率を更新
+        optimizer: オプティマイザ
+        step: 現在のステップ
+        num_steps: 総ステップ数
+        """
+        progress = step / max(num_steps - 1, 1)
+        for group in optimizer.param_groups:
+            schedule, final_ratio = group['schedule'], group['final_ratio']
+            if schedule == "linear":
+                factor = 1.0 - (1.0 - final_ratio) * progress
+            elif schedule == "cosine":
+                factor = final_ratio + (1.0 - final_ratio) * 0.5 * (1.0 + np.cos(np.pi * progress))
+            elif schedule == "exponential":
+                factor = final_ratio ** progress
+            else:
+                factor = 1.0
+            group['lr'] = group['base_lr'] * float(factor)
+
+    def _step_skip_zero_grad(self, optimizer:optim.Optimizer):
+        """
+        勾配が0のガウシアンを更新せずにオプティマイザを1ステップ進める
+        note:
+          Adamはモーメントにより勾配0でもパラメタを動かすため、該当するガウシアンのパラメタと
+          モーメントを更新前の値に戻す（遅延(lazy)更新。結果を変えるためのもので高速化ではない）。
+          内部では通常の1ステップを全体に実行したうえで該当行を戻すため、オプティマイザの計算量は減らず、
+          該当の有無を調べるためにステップごとにGPUとの同期が1回入る（通常の1ステップより必ず遅い）。
+          ステップ数のカウンタはグループ共通のため、戻したガウシアンのバイアス補正は近似になる。
+        optimizer: オプティマイザ
+        """
+        params = [p for group in optimizer.param_groups for p in group['params']]
+        zero_grad = torch.ones(self.num_gaussians, dtype=torch.bool, device=self.device)
+        for p in params:
+            if p.grad is not None:
+                zero_grad &= (p.grad.reshape(self.num_gaussians, -1) == 0).all(dim=1)
+        indices = zero_grad.nonzero().squeeze(1)
+        if indices.numel() == 0:
+            # 該当なし（描画が密なため通常はこちら）
+            optimizer.step()
+            return
+
+        # 該当するガウシアンの行だけ更新前の値を保存（初回はモーメント未作成のため0に戻す）
+        saved = []
+        for p in params:
+            state = optimizer.state.get(p, {})
+            moments = {key: state[key][indices].clone() if key in state else None
+                       for key in ('exp_avg', 'exp_avg_sq')}
+            saved.append((p, p.detach()[indices].clone(), moments))
+
+        optimizer.step()
+
+        # 該当するガウシアンの行を更新前の値に戻す
+        with torch.no_grad():
+            for p, prev_data, moments in saved:
+                p[indices] = prev_data
+                state = optimizer.state[p]
+                for key, prev_value in moments.items():
+                    state[key][indices] = 0 if prev_value is None else prev_value
+
     async def calculate_async(self, num_steps:int=_NUM_STEPS, opt_lr:float=_LEARNING_RATE, 
-                             loss_func_name:str="_calc_loss_l1_ssim", update_interval:int=100, websocket=None):
+                             loss_func_name:str="_calc_loss_l1_ssim", update_interval:int=100, channel=None,
+                             snap_interval:int=0, snap_format:str="video",
+                             reuse_optimizer:bool=False, tol:float=0.0, patience:int=0,
+                             param_groups:dict=None, optimizer_impl:str="auto",
+                             skip_zero_grad:bool=False) -> dict:
         """
         2DGSの計算実行（非同期版）
         num_steps: 学習時のイテレーション回数 
         opt_lr: 学習率
         loss_func_name: 誤差計算用の関数名
         update_interval: イテレーションごとの更新タイミング
-        websocket: websocket（接続が失われた際の更新エラー防止用）
+        channel: 途中経過の配信先(ProgressChannel)。購読者がいなければ途中経過の画像は作らない
+        snap_interval: 録画するイテレーション間隔（0なら録画しない。save_dir未設定時も録画しない）
+        snap_format: 録画形式 ("video": mp4動画, "images": 連番png)
+        reuse_optimizer: Trueなら前回の学習のオプティマイザ状態を引き継ぐ
+        tol: 収束判定の相対改善量。損失の改善がbest*tol未満なら停滞とみなす
+        patience: 停滞がこのステップ数続いたら収束として終了（0なら収束判定しない）
+        param_groups: パラメタ名('means', 'sigmas', 'weights')ごとの学習率設定（_build_param_groupsを参照）
+        optimizer_impl: Adamの実装 ("auto" / "fused" / "foreach" / "for-loop")
+        skip_zero_grad: Trueなら勾配が0のガウシアンを更新しない（遅延更新。通常より遅くなる。_step_skip_zero_gradを参照）
+        return: {'steps': 実行したステップ数, 'loss': 最終損失}
         """
         target_img = self.img_array
-        optimizer = optim.Adam(self.params.parameters(), lr=opt_lr)
-        
-        for step in range(num_steps):
-            # 中断チェック
-            if self.should_stop:
-                print(f"[Train] Step {step}: 学習を中断しました")
-                if websocket:
-                    await websocket.send_json({
-                        "type": "log",
-                        "message": f"Step {step}: 学習を中断しました"
-                    })
-                break
+        optimizer = self._get_optimizer(opt_lr, reuse_optimizer, param_groups, optimizer_impl)
+        steps_done = 0
+        loss_value = None
+        best_loss = float('inf')
+        num_stall = 0
+        if snap_interval > 0 and self.save_dir is not None:
+            self.recorder = SnapRecorder(self.save_dir, format=snap_format)
+            self.recorder.start()
+        elif snap_interval > 0:
+            message = "保存先(SNAP_SAVE_DIR)が未設定か存在しないため録画しません"
+            print(f"[Train] {message}")
+            if channel:
+                channel.publish({"type": "log", "message": message}, droppable=False)
+
+        try:
+            for step in range(num_steps):
+                # 中断チェック
+                if self.should_stop:
+                    print(f"[Train] Step {step}: 学習を中断しました")
+                    if channel:
+                        channel.publish({
+                            "type": "log",
+                            "message": f"Step {step}: 学習を中断しました"
+                        }, droppable=False)
+                    break
             
-            # 予測画像を作成
-            optimizer.zero_grad()
-            img_pred = self._generate_predicted_image()
-
-            # 誤差計算
-            method = getattr(self, loss_func_name, None)
-            loss = method(img_pred, target_img)
-            loss.backward()
-            optimizer.step()
+                # 予測画像を作成
+                optimizer.zero_grad()
+                self._update_lr(optimizer, step, num_steps)
+                img_pred = self._generate_predicted_image()
 
-            # 定期的に更新
-            if step % update_interval == 0 or step == num_steps - 1:
-                message = f"Step {step+1}/{num_steps} Loss: {loss.item():.6f}"
-                print(message)
+                # 誤差計算
+                method = getattr(self, loss_func_name, None)
+                loss = method(img_pred, target_img)
+                loss.backward()
+                if skip_zero_grad:
+                    self._step_skip_zero_grad(optimizer)
+                else:
+                    optimizer.step()
+                steps_done = step + 1
+                self._index_dirty = True
+
+                # 録画
+                if self.recorder is not None and step % snap_interval == 0:
+                    self.__save_snap_image(img_pred, step)
+
+                # 定期的に更新
+                if step % update_interval == 0 or step == num_steps - 1:
+                    message = f"Step {step+1}/{num_steps} Loss: {loss.item():.6f}"
+                    print(message)
                 
-                if websocket:
-                    images = self.generate_current_images()
-                    b64img_pred = ImageManager.cv2_to_base64(images["predicted"])
-                    b64img_predpoint = ImageManager.cv2_to_base64(images["points"])
+                    # 画像のエンコードは購読者数によらず1回だけ
+                    if channel and channel.num_subscribers > 0:
+                        images = self.generate_current_images()
+                        b64img_pred = ImageManager.cv2_to_base64(images["predicted"])
+                        b64img_predpoint = ImageManager.cv2_to_base64(images["points"])
                     
-                    await websocket.send_json({
-                        "type": "update",
-                        "step": step + 1,
-                        "total_steps": num_steps,
-                        "loss": loss.item(),
-                        "message": message,
-                        "predicted_image": b64img_pred,
-                        "points_image": b64img_predpoint
-                    })
+                        channel.publish({
+                            "type": "update",
+                            "step": step + 1,
+                            "total_steps": num_steps,
+                            "loss": loss.item(),
+                            "message": message,
+                            "predicted_image": b64img_pred,
+                            "points_image": b64img_predpoint
+                        })
                 
-                # 非同期処理のため少し待つ
-                await asyncio.sleep(0.01)
+                    # 非同期処理のため少し待つ
+                    await asyncio.sleep(0.01)
+
+                # 収束判定
+                if patience > 0:
+                    loss_value = loss.item()
+                    if loss_value < best_loss * (1.0 - tol):
+                        best_loss = loss_value
+                        num_stall = 0
+                    else:
+                        num_stall += 1
+                    if num_stall >= patience:
+                        print(f"[Train] Step {step+1}: 収束したため終了します Loss: {loss_value:.6f}")
+                        break
+        finally:
+            # 録画終了（書き出し待ちでイベントループを止めないよう別スレッドで行う）
+            await asyncio.to_thread(self.__create_snap_video)
+
+        if steps_done > 0 and loss_value is None:
+            loss_value = loss.item()
+        return {"steps": steps_done, "loss": loss_value}
 
-    def __save_snap_image(self):
-        """イテレーションごとの画像を保存する"""
-        raise NotImplementedError
+    def __save_snap_image(self, img_pred:torch.Tensor, step:int):
+        """
+        イテレーションごとの画像を録画キューへ渡す
+        note: 書き出しはライタースレッドで行う。キューが満杯ならフレームを破棄する
+        img_pred: 推論画像 (H, W)
+        step: 学習ステップ
+        """
+        frame = img_pred.detach().cpu().numpy()
+        self.recorder.push(frame, step)
     
     def __create_snap_video(self):
-        """保存した画像から動画を作成する"""
-        raise NotImplementedError
+        """録画を終了し、キューに残ったフレームを書き出す"""
+        if self.recorder is None:
+            return
+        self.recorder.stop()
+        self.recorder = None
 
 if __name__ == "__main__":
     pil_image = ImageManager.open_from_filepath('/mnt/project/testdata/02_kirara_undercoat_black-modified.png')
@@ -329,6 +628,13 @@ if __name__ == "__main__":
     gs.initialize(pil_image)
     initial_images = gs.generate_current_images()
 
+    # sigmaが0に近い・相関が極端な場合も共分散行列が正定値のまま描画できること
+    params = gs.get_params_numpy()
+    params['sigmas'][0] = [0.02, 5.0, 0.0]
+    params['sigmas'][1] = [0.0, 0.0, 0.0]
+    params['sigmas'][2] = [3.0, 3.0, 100.0]
+    assert np.isfinite(gs.render_params_numpy(params)).all()
+
     async def test():
         await gs.calculate_async(num_gaussians:=1, num_steps:=10)
     asyncio.run(test())
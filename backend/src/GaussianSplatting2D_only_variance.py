@@ -31,15 +31,16 @@ class GaussianSplatting2D_only_variance(GaussianSplatting2D):
         num_gaussians: ガウシアン点数
         """
         self.num_gaussians = num_gaussians
-        torch.manual_seed(GaussianSplatting2D._RAND_SEED)
+        # 並行する他の処理とグローバルの乱数を共有しないよう、専用の乱数生成器を使う
+        generator = torch.Generator(device=self.device).manual_seed(GaussianSplatting2D._RAND_SEED)
         height, width = self.img_array.shape
 
         # ガウシアンパラメタの初期化（位置x,y、分散s_x, s_y、重みw）
         self.params = nn.ParameterDict({
-            'means': nn.Parameter(torch.rand(num_gaussians, 2, dtype=torch.float32, device=self.device) * \
+            'means': nn.Parameter(torch.rand(num_gaussians, 2, dtype=torch.float32, device=self.device, generator=generator) * \
                                   torch.tensor([width, height], dtype=torch.float32, device=self.device)),
             'sigmas': nn.Parameter(torch.ones(num_gaussians, 2, dtype=torch.float32, device=self.device) * 5.0),
-            'weights': nn.Parameter(torch.rand(num_gaussians, dtype=torch.float32, device=self.device) * 0.5 + 0.5)
+            'weights': nn.Parameter(torch.rand(num_gaussians, dtype=torch.float32, device=self.device, generator=generator) * 0.5 + 0.5)
         })
 
         # 計算用座標配列も初期化
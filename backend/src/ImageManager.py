@@ -2,12 +2,19 @@ import numpy as np
 from PIL import Image
 import cv2
 import io, os, base64
+import asyncio, hashlib, threading
+from collections import OrderedDict
 from fastapi import UploadFile, HTTPException
 
 class ImageManager:
     """
     画像変換関係のユーティリティクラス
     """
+    _CHUNK_SIZE:int = 1 << 20     # アップロードファイルの読み込み単位[byte]
+    _CACHE_SIZE:int = 8           # デコード済み画像のキャッシュ数
+    _decode_cache = OrderedDict() # (内容のハッシュ, 高さ) -> デコード・リサイズ済みの画像
+    _cache_lock = threading.Lock()
+
     @staticmethod
     def open_from_filepath(filepath: str) -> Image:
         """ファイルパスからPIL Imageを開く"""
@@ -29,6 +36,65 @@ class ImageManager:
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"画像の読み込みに失敗しました: {str(e)}")
 
+    @staticmethod
+    async def read_uploadfile_async(file: UploadFile, chunk_size: int = _CHUNK_SIZE) -> tuple:
+        """
+        アップロードファイルを分割して非同期に読み込む
+        note: 大きなファイルでもメモリ上に内容を2重に持たないよう、BytesIOに直接書き込んでそのまま返す
+        return: (ファイル内容のBytesIO（先頭に位置付け済み）, 内容のSHA-256)
+        """
+        hasher = hashlib.sha256()
+        image_data = io.BytesIO()
+        while chunk := await file.read(chunk_size):
+            hasher.update(chunk)
+            image_data.write(chunk)
+        image_data.seek(0)
+        return image_data, hasher.hexdigest()
+
+    @staticmethod
+    def decode_resized(image_data: io.BytesIO, resize_h: int) -> Image:
+        """
+        縮小を前提に画像をデコードし、グレースケールにして指定の高さにリサイズ
+        note: JPEGはdraftモードで縮小デコードし、その他の形式もreducing_gapで縮小を高速化する
+        image_data: 画像ファイルの内容（バイナリストリーム）
+        resize_h: リサイズ後の高さ（幅はアスペクト比を保つ）
+        return: グレースケールのPIL Image
+        """
+        image = Image.open(image_data)
+        org_w, org_h = image.size
+        resize_w = int(resize_h * org_w / org_h)
+        if image.format == 'JPEG':
+            image.draft('L', (resize_w, resize_h))
+        if image.mode == 'RGBA':
+            image = image.convert('RGB')
+        return image.convert('L').resize((resize_w, resize_h), reducing_gap=2.0)
+
+    @staticmethod
+    async def open_resized_from_uploadfile(file: UploadFile, resize_h: int) -> Image:
+        """
+        アップロードファイルから学習用のPIL Imageを作成
+        note: 読み込みは非同期、デコードとリサイズはスレッドプールで行い、結果は内容のハッシュでキャッシュする
+        file: アップロードファイル
+        resize_h: リサイズ後の高さ（幅はアスペクト比を保つ）
+        return: グレースケールのPIL Image
+        """
+        try:
+            image_data, digest = await ImageManager.read_uploadfile_async(file)
+            key = (digest, resize_h)
+            with ImageManager._cache_lock:
+                if key in ImageManager._decode_cache:
+                    ImageManager._decode_cache.move_to_end(key)
+                    return ImageManager._decode_cache[key].copy()
+
+            image = await asyncio.to_thread(ImageManager.decode_resized, image_data, resize_h)
+            with ImageManager._cache_lock:
+                ImageManager._decode_cache[key] = image
+                while len(ImageManager._decode_cache) > ImageManager._CACHE_SIZE:
+                    ImageManager._decode_cache.popitem(last=False)
+            return image.copy()
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"画像の読み込みに失敗しました: {str(e)}")
+
     @staticmethod
     def pil_to_bytes(image: Image.Image, format: str = "PNG") -> io.BytesIO:
         """PIL Imageをバイトストリームに変換"""
@@ -0,0 +1,79 @@
+import numpy as np
+from SpatialIndex import SpatialIndex
+
+class LevelOfDetail:
+    """
+    ガウシアンの寄与度による順位付けと詳細度(LOD)レイヤ分割
+    """
+    _NUM_SIGMA:float = 3.0        # デフォルト値：フットプリントに含める範囲[sigma]
+    _BASE_FRACTION:float = 0.02   # デフォルト値：最初のレイヤに含めるガウシアンの割合
+    _GROWTH:float = 2.0           # デフォルト値：レイヤごとのガウシアン数の増加率
+
+    @staticmethod
+    def contribution_scores(params:dict, width:int, height:int, num_sigma:float=_NUM_SIGMA) -> np.ndarray:
+        """
+        ガウシアンごとの画像への寄与度を計算
+        note:
+          寄与度 = |weight| * フットプリント(k sigmaの外接矩形)のうち画像内に入る割合。
+          ガウシアンは正規化されている（画像全体での積分 = weight）ため、大きさによらず
+          weightが描画される総量となり、画像外にはみ出した分だけ寄与が減る。
+        params: {'means': (N, 2), 'sigmas': (N, 3) or (N, 2), 'weights': (N,)}
+        width: 画像幅
+        height: 画像高さ
+        num_sigma: フットプリントに含める範囲[sigma]
+        return: (N,) の寄与度
+        """
+        cov = SpatialIndex.covariance_from_sigmas(params['sigmas'])
+        half = num_sigma * np.sqrt(np.maximum(cov[:, :2], 1e-12))
+        lower = params['means'] - half
+        upper = params['means'] + half
+        inside = np.clip(np.minimum(upper, [width, height]) - np.maximum(lower, 0), 0, None)
+        visible = (inside[:, 0] * inside[:, 1]) / (4 * half[:, 0] * half[:, 1])
+
+        return np.abs(params['weights']) * visible
+
+    @staticmethod
+    def rank(params:dict, width:int, height:int) -> np.ndarray:
+        """
+        寄与度の大きい順にガウシアンを並べる
+        params: {'means': (N, 2), 'sigmas': (N, 3) or (N, 2), 'weights': (N,)}
+        width: 画像幅
+        height: 画像高さ
+        return: (N,) のインデックス（寄与度の降順）
+        """
+        scores = LevelOfDetail.contribution_scores(params, width, height)
+        return np.argsort(-scores, kind='stable')
+
+    @staticmethod
+    def build_layers(order:np.ndarray, base_fraction:float=_BASE_FRACTION, growth:float=_GROWTH) -> list:
+        """
+        順位付けしたガウシアンをレイヤに分割
+        note: 先頭レイヤは全体のbase_fraction、以降はgrowth倍ずつ大きくする
+        order: 寄与度の降順に並べたインデックス
+        base_fraction: 最初のレイヤに含めるガウシアンの割合
+        growth: レイヤごとのガウシアン数の増加率
+        return: レイヤごとのインデックス配列のリスト
+        """
+        if not 0 < base_fraction <= 1 or growth < 1:
+            raise ValueError(f"レイヤの設定が不正です: base_fraction={base_fraction}, growth={growth}")
+        layers = []
+        start = 0
+        size = max(int(np.ceil(len(order) * base_fraction)), 1)
+        while start < len(order):
+            layers.append(order[start:start + size])
+            start += size
+            size = max(int(np.ceil(size * growth)), size + 1)
+        return layers
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    params = {
+        'means': rng.random((1000, 2), dtype=np.float32) * [200, 250],
+        'sigmas': np.column_stack([rng.random((1000, 2)) * 10 + 1, np.zeros(1000)]).astype(np.float32),
+        'weights': rng.random(1000, dtype=np.float32)
+    }
+    order = LevelOfDetail.rank(params, 200, 250)
+    layers = LevelOfDetail.build_layers(order)
+    print(f"layers: {[len(layer) for layer in layers]}")
+    print("LevelOfDetail test OK")
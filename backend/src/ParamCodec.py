@@ -0,0 +1,140 @@
+import struct, zlib
+import numpy as np
+
+class ParamCodec:
+    """
+    ガウシアンパラメタのコンパクトなバイナリ形式への変換
+    note:
+      ヘッダ: magic(4) version(1) flags(1) bits(1) reserved(1) N(4)
+      本体  : 属性ごとの列 [mean_x, mean_y, sigma_x, sigma_y, (sigma_xy), weight]
+        - quantizedモード: 属性ごとに min/max(float32) の後に bitsビットの整数列
+        - float16モード   : float16の列
+      本体は任意でzlib圧縮する。空間ソート時はガウシアンをMorton順に並べ替える（元の順序は保持しない）。
+    """
+    _MAGIC:bytes = b"2DGQ"
+    _VERSION:int = 1
+    _HEADER = struct.Struct("<4sBBBBI")
+    _FLAG_COVARIANCE:int = 0x01
+    _FLAG_COMPRESSED:int = 0x02
+    _FLAG_FLOAT16:int = 0x04
+    _FLAG_SORTED:int = 0x08
+    _MODES = ("quantized", "float16")
+    _BITS = {8: np.uint8, 16: np.uint16}
+
+    @staticmethod
+    def encode(params:dict, mode:str="quantized", bits:int=16, compress:bool=True,
+               spatial_sort:bool=True) -> bytes:
+        """
+        ガウシアンパラメタをバイト列に変換
+        params: {'means': (N, 2), 'sigmas': (N, 3) or (N, 2), 'weights': (N,)}
+        mode: "quantized"（属性ごとにmin/maxで量子化）または "float16"
+        bits: quantizedモードの量子化ビット数 (8 or 16)
+        compress: Trueならzlib圧縮する
+        spatial_sort: Trueなら中心座標のMorton順に並べ替える（圧縮率と局所性の向上）
+        return: バイト列
+        """
+        if mode not in ParamCodec._MODES:
+            raise ValueError(f"サポートされていないモード: {mode}")
+        if mode == "quantized" and bits not in ParamCodec._BITS:
+            raise ValueError(f"サポートされていない量子化ビット数: {bits}")
+
+        columns = np.column_stack([params['means'], params['sigmas'],
+                                   params['weights'][:, None]]).astype(np.float32)
+        has_covariance = params['sigmas'].shape[1] == 3
+        if spatial_sort and len(columns) > 1:
+            columns = columns[np.argsort(ParamCodec._morton_code(columns[:, :2]), kind='stable')]
+
+        flags = ParamCodec._FLAG_COVARIANCE if has_covariance else 0
+        flags |= ParamCodec._FLAG_SORTED if spatial_sort else 0
+        if mode == "float16":
+            flags |= ParamCodec._FLAG_FLOAT16
+            body = np.ascontiguousarray(columns.T.astype(np.float16)).tobytes()
+        else:
+            mins = columns.min(axis=0) if len(columns) else np.zeros(columns.shape[1], np.float32)
+            maxs = columns.max(axis=0) if len(columns) else np.zeros(columns.shape[1], np.float32)
+            levels = (1 << bits) - 1
+            scales = np.where(maxs > mins, (maxs - mins) / levels, 1.0).astype(np.float32)
+            quantized = np.rint((columns - mins) / scales).clip(0, levels).astype(ParamCodec._BITS[bits])
+            body = np.column_stack([mins, maxs]).astype(np.float32).tobytes() + \
+                   np.ascontiguousarray(quantized.T).tobytes()
+        if compress:
+            flags |= ParamCodec._FLAG_COMPRESSED
+            body = zlib.compress(body, level=6)
+
+        header = ParamCodec._HEADER.pack(ParamCodec._MAGIC, ParamCodec._VERSION, flags,
+                                         bits if mode == "quantized" else 16, 0, len(columns))
+        return header + body
+
+    @staticmethod
+    def decode(data:bytes) -> dict:
+        """
+        バイト列をガウシアンパラメタに変換
+        data: encode()で作成したバイト列
+        return: {'means': (N, 2), 'sigmas': (N, 3) or (N, 2), 'weights': (N,)}
+        """
+        if len(data) < ParamCodec._HEADER.size:
+            raise ValueError("データが短すぎます")
+        magic, version, flags, bits, _, num = ParamCodec._HEADER.unpack_from(data)
+        if magic != ParamCodec._MAGIC:
+            raise ValueError("パラメタ形式ではありません")
+        if version != ParamCodec._VERSION:
+            raise ValueError(f"サポートされていないバージョン: {version}")
+
+        body = data[ParamCodec._HEADER.size:]
+        if flags & ParamCodec._FLAG_COMPRESSED:
+            body = zlib.decompress(body)
+        num_columns = 6 if flags & ParamCodec._FLAG_COVARIANCE else 5
+
+        if flags & ParamCodec._FLAG_FLOAT16:
+            columns = np.frombuffer(body, dtype=np.float16, count=num_columns * num)
+            columns = columns.reshape(num_columns, num).T.astype(np.float32)
+        else:
+            if bits not in ParamCodec._BITS:
+                raise ValueError(f"サポートされていない量子化ビット数: {bits}")
+            ranges = np.frombuffer(body, dtype=np.float32, count=num_columns * 2).reshape(num_columns, 2)
+            quantized = np.frombuffer(body, dtype=ParamCodec._BITS[bits], count=num_columns * num,
+                                      offset=ranges.nbytes).reshape(num_columns, num).T
+            mins, maxs = ranges[:, 0], ranges[:, 1]
+            scales = np.where(maxs > mins, (maxs - mins) / ((1 << bits) - 1), 1.0).astype(np.float32)
+            columns = quantized.astype(np.float32) * scales + mins
+
+        return {
+            'means': np.ascontiguousarray(columns[:, 0:2]),
+            'sigmas': np.ascontiguousarray(columns[:, 2:num_columns - 1]),
+            'weights': np.ascontiguousarray(columns[:, num_columns - 1])
+        }
+
+    @staticmethod
+    def _morton_code(points:np.ndarray) -> np.ndarray:
+        """
+        2次元座標のMorton(Zオーダー)コードを計算
+        points: (N, 2) の座標
+        return: (N,) のuint32コード
+        """
+        mins = points.min(axis=0)
+        extent = np.maximum(points.max(axis=0) - mins, 1e-6)
+        grid = ((points - mins) / extent * 65535).astype(np.uint32)
+
+        def spread(v):
+            # 16ビットの値を1ビットおきに配置
+            v = (v | (v << 8)) & 0x00FF00FF
+            v = (v | (v << 4)) & 0x0F0F0F0F
+            v = (v | (v << 2)) & 0x33333333
+            v = (v | (v << 1)) & 0x55555555
+            return v
+        return spread(grid[:, 0]) | (spread(grid[:, 1]) << 1)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    params = {
+        'means': rng.random((1000, 2), dtype=np.float32) * 250,
+        'sigmas': np.column_stack([rng.random((1000, 2)) * 10, rng.standard_normal(1000)]).astype(np.float32),
+        'weights': rng.random(1000, dtype=np.float32)
+    }
+    for mode, bits in (("quantized", 8), ("quantized", 16), ("float16", 16)):
+        data = ParamCodec.encode(params, mode=mode, bits=bits, spatial_sort=False)
+        decoded = ParamCodec.decode(data)
+        error = max(np.abs(decoded[key] - params[key]).max() for key in params)
+        print(f"{mode}/{bits}: bytes={len(data)}, max error={error:.6f}")
+    print("ParamCodec test OK")
@@ -0,0 +1,146 @@
+import json, asyncio
+from collections import deque
+from typing import Optional
+
+class ProgressSubscriber:
+    """
+    学習経過の購読者
+    note:
+      購読者ごとに有界のキューを持つ。間引き可能なメッセージ（途中経過の画像）は
+      キューの上限を超えると古いものから捨てる（最新フレーム優先）。
+      開始・完了・エラー等の間引き不可のメッセージは捨てない。
+    """
+
+    def __init__(self, channel:"ProgressChannel", queue_size:int):
+        """
+        コンストラクタ
+        channel: 購読先のチャネル
+        queue_size: 間引き可能なメッセージを溜められる数
+        """
+        self.channel = channel
+        self.queue_size = queue_size
+        self.closed = False
+        self.num_dropped = 0
+        self._items = deque()      # (エンコード済みメッセージ, 間引き可能か)
+        self._event = asyncio.Event()
+
+    def offer(self, text:str, droppable:bool=True):
+        """
+        メッセージをキューに追加（ブロックしない）
+        text: エンコード済みメッセージ
+        droppable: Trueなら上限を超えたときに古いものから捨てる
+        """
+        if droppable:
+            num_droppable = sum(1 for _, d in self._items if d)
+            while num_droppable >= self.queue_size:
+                oldest = next(item for item in self._items if item[1])
+                self._items.remove(oldest)
+                num_droppable -= 1
+                self.num_dropped += 1
+        self._items.append((text, droppable))
+        self._event.set()
+
+    def close(self):
+        """購読を終了（キューに残ったメッセージは取り出せる）"""
+        self.closed = True
+        self._event.set()
+
+    def unsubscribe(self):
+        """チャネルから購読を解除"""
+        self.channel.unsubscribe(self)
+
+    async def get(self) -> Optional[str]:
+        """
+        次のメッセージを取得
+        return: エンコード済みメッセージ。購読終了後にキューが空ならNone
+        """
+        while not self._items:
+            if self.closed:
+                return None
+            self._event.clear()
+            await self._event.wait()
+        text, _ = self._items.popleft()
+        return text
+
+class ProgressChannel:
+    """
+    学習ジョブごとの経過配信チャネル（publish/subscribe）
+    note: メッセージは1回だけJSONにエンコードし、全購読者で共有する
+    """
+    _QUEUE_SIZE:int = 1    # デフォルト値：購読者ごとに溜められる途中経過の数
+
+    def __init__(self, job_id:str, queue_size:int=_QUEUE_SIZE):
+        """
+        コンストラクタ
+        job_id: 学習ジョブのID
+        queue_size: 購読者ごとに溜められる途中経過の数
+        """
+        self.job_id = job_id
+        self.queue_size = queue_size
+        self.closed = False
+        self.last_message = None   # 途中から購読した場合に最初に送る最新の途中経過
+        self._subscribers = set()
+
+    @property
+    def num_subscribers(self) -> int:
+        """購読者数"""
+        return len(self._subscribers)
+
+    def subscribe(self, queue_size:int=None) -> ProgressSubscriber:
+        """
+        購読を開始
+        queue_size: 溜められる途中経過の数（Noneならチャネルの既定値）
+        return: 購読者
+        """
+        subscriber = ProgressSubscriber(self, queue_size or self.queue_size)
+        if self.last_message is not None:
+            subscriber.offer(self.last_message)
+        if self.closed:
+            subscriber.close()
+        else:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber:ProgressSubscriber):
+        """
+        購読を解除
+        subscriber: 購読者
+        """
+        self._subscribers.discard(subscriber)
+        subscriber.close()
+
+    def publish(self, message:dict, droppable:bool=True):
+        """
+        全購読者にメッセージを配信
+        message: メッセージ
+        droppable: Trueなら購読者のキューが溢れたとき古いものから捨てる（途中経過用）
+        """
+        text = json.dumps(message)
+        if droppable:
+            self.last_message = text
+        for subscriber in list(self._subscribers):
+            subscriber.offer(text, droppable)
+
+    def close(self):
+        """配信を終了し、全購読者の購読を終了する"""
+        self.closed = True
+        for subscriber in list(self._subscribers):
+            subscriber.close()
+        self._subscribers.clear()
+
+
+if __name__ == "__main__":
+    async def test():
+        channel = ProgressChannel("test")
+        fast = channel.subscribe()
+        slow = channel.subscribe(queue_size=2)
+        for step in range(10):
+            channel.publish({"type": "update", "step": step})
+            print(f"fast: {await fast.get()}")
+        channel.publish({"type": "complete"}, droppable=False)
+        channel.close()
+        while (text := await slow.get()) is not None:
+            print(f"slow: {text}")
+        print(f"slow dropped: {slow.num_dropped}")
+    asyncio.run(test())
+    print("ProgressChannel test OK")
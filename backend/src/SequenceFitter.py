@@ -0,0 +1,137 @@
+import io
+import numpy as np
+from GaussianSplatting2D import GaussianSplatting2D
+
+class SequenceFitter:
+    """
+    連続フレーム（動画・アニメーション）の2DGS近似
+    note:
+      各フレームを前フレームの最適化結果から学習を始め（ウォームスタート）、
+      損失が収束した時点で次のフレームへ進む。
+    """
+    _FIRST_STEPS:int = 10000   # デフォルト値：先頭フレームの最大ステップ数
+    _MAX_STEPS:int = 2000      # デフォルト値：2フレーム目以降の最大ステップ数
+    _TOL:float = 1e-4          # デフォルト値：収束判定の相対改善量
+    _PATIENCE:int = 100        # デフォルト値：収束判定の停滞ステップ数
+    _UPDATE_INTERVAL:int = 100 # イベントループに制御を返すステップ間隔（/stop等を受け付けるため）
+
+    def __init__(self, gs:GaussianSplatting2D, reuse_optimizer:bool=True):
+        """
+        コンストラクタ
+        gs: 学習に使うGaussianSplatting2Dインスタンス
+        reuse_optimizer: Trueならフレーム間でオプティマイザ状態も引き継ぐ
+        """
+        self.gs = gs
+        self.reuse_optimizer = reuse_optimizer
+        self.frame_params = []    # フレームごとのガウシアンパラメタ
+        self.frame_steps = []     # フレームごとの実行ステップ数
+        self.frame_losses = []    # フレームごとの最終損失
+
+    async def fit(self, frames:list, resize_w:int, resize_h:int, num_gaussians:int,
+                  opt_lr:float=GaussianSplatting2D._LEARNING_RATE,
+                  first_steps:int=_FIRST_STEPS, max_steps:int=_MAX_STEPS,
+                  tol:float=_TOL, patience:int=_PATIENCE,
+                  loss_func_name:str="_calc_loss_l1_ssim") -> list:
+        """
+        フレームを順に学習
+        frames: 入力画像(PIL Image)のリスト。先頭から順に処理する
+        resize_w: リサイズ後の画像幅
+        resize_h: リサイズ後の画像高さ
+        num_gaussians: ガウシアン点の数
+        opt_lr: 学習率
+        first_steps: 先頭フレームの最大ステップ数
+        max_steps: 2フレーム目以降の最大ステップ数
+        tol: 収束判定の相対改善量
+        patience: 収束判定の停滞ステップ数
+        loss_func_name: 誤差計算用の関数名
+        return: フレームごとのガウシアンパラメタ(numpy配列のdict)のリスト
+        """
+        self.frame_params, self.frame_steps, self.frame_losses = [], [], []
+        for idx, frame in enumerate(frames):
+            if self.gs.should_stop:
+                print(f"[Sequence] Frame {idx}: 中断しました")
+                break
+
+            if idx == 0:
+                self.gs.initialize(frame, resize_w=resize_w, resize_h=resize_h,
+                                   num_gaussians=num_gaussians)
+                num_steps = first_steps
+            else:
+                self.gs.set_target_image(frame)
+                num_steps = max_steps
+
+            result = await self.gs.calculate_async(num_steps=num_steps, opt_lr=opt_lr,
+                                                   loss_func_name=loss_func_name,
+                                                   update_interval=SequenceFitter._UPDATE_INTERVAL,
+                                                   reuse_optimizer=self.reuse_optimizer and idx > 0,
+                                                   tol=tol, patience=patience)
+            self.frame_params.append(self.gs.get_params_numpy())
+            self.frame_steps.append(result["steps"])
+            self.frame_losses.append(result["loss"])
+            print(f"[Sequence] Frame {idx+1}/{len(frames)}: steps={result['steps']}, loss={result['loss']}")
+
+        return self.frame_params
+
+    @staticmethod
+    def encode(frame_params:list) -> bytes:
+        """
+        フレームごとのパラメタを差分符号化したコンテナに変換
+        note:
+          先頭フレームはfloat32のまま保持し、以降は直前フレーム（復号後の値）との差分をfloat16で保持する。
+          復号後の値との差分を取るため、float16の丸め誤差はフレーム間で蓄積しない。
+        frame_params: get_params_numpy()形式のdictのリスト（全フレームでガウシアン数は同じ）
+        return: npz形式(圧縮)のバイト列
+        """
+        if len(frame_params) == 0:
+            raise ValueError("フレームがありません")
+
+        arrays = {}
+        for key in frame_params[0].keys():
+            keyframe = frame_params[0][key].astype(np.float32)
+            prev = keyframe
+            deltas = []
+            for params in frame_params[1:]:
+                delta = (params[key].astype(np.float32) - prev).astype(np.float16)
+                prev = prev + delta.astype(np.float32)
+                deltas.append(delta)
+            arrays[f"{key}_key"] = keyframe
+            arrays[f"{key}_delta"] = np.stack(deltas) if deltas else \
+                                     np.zeros((0,) + keyframe.shape, dtype=np.float16)
+
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        return buffer.getvalue()
+
+    @staticmethod
+    def decode(data:bytes) -> list:
+        """
+        差分符号化したコンテナを復号
+        data: encode()で作成したバイト列
+        return: フレームごとのガウシアンパラメタ(numpy配列のdict)のリスト
+        """
+        with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+            keys = [name[:-len("_key")] for name in npz.files if name.endswith("_key")]
+            decoded = {}
+            for key in keys:
+                keyframe = npz[f"{key}_key"][None]
+                deltas = npz[f"{key}_delta"].astype(np.float32)
+                decoded[key] = np.cumsum(np.concatenate([keyframe, deltas]), axis=0)
+
+        num_frames = len(decoded[keys[0]])
+        return [{key: decoded[key][idx] for key in keys} for idx in range(num_frames)]
+
+
+if __name__ == "__main__":
+    import asyncio
+    from ImageManager import ImageManager
+
+    pil_image = ImageManager.open_from_filepath('/mnt/project/testdata/sample1.png')
+    frames = [pil_image.rotate(angle) for angle in range(0, 5)]
+    fitter = SequenceFitter(GaussianSplatting2D())
+    frame_params = asyncio.run(fitter.fit(frames, resize_w=100, resize_h=125, num_gaussians=100,
+                                          first_steps=200, max_steps=100, patience=20))
+    data = SequenceFitter.encode(frame_params)
+    decoded = SequenceFitter.decode(data)
+    print(f"steps={fitter.frame_steps}, bytes={len(data)}")
+    print(f"max error={max(np.abs(d['means'] - p['means']).max() for d, p in zip(decoded, frame_params))}")
+    print("SequenceFitter test OK")
@@ -0,0 +1,127 @@
+import os, time
+import queue
+import threading
+import numpy as np
+import cv2
+
+class SnapRecorder:
+    """
+    学習途中の推論画像を録画するクラス
+    note:
+      フレームは有界キューを介してバックグラウンドのライタースレッドへ渡し、
+      動画(mp4)または連番画像(png)として保存する。
+      キューが満杯の場合はフレームを破棄し、学習ループを待たせない。
+    """
+    _FPS:int = 30              # デフォルト値：動画のフレームレート
+    _MAX_QUEUE:int = 64        # デフォルト値：キューに溜められるフレーム数
+    _FORMATS = ("video", "images")
+
+    def __init__(self, save_dir:str, format:str="video", fps:int=_FPS, max_queue:int=_MAX_QUEUE):
+        """
+        コンストラクタ
+        save_dir: 保存先ディレクトリ
+        format: 保存形式 ("video": mp4動画, "images": 連番png)
+        fps: 動画のフレームレート
+        max_queue: キューに溜められるフレーム数
+        """
+        if format not in SnapRecorder._FORMATS:
+            raise ValueError(f"サポートされていない保存形式: {format}")
+        self.save_dir = save_dir
+        self.format = format
+        self.fps = fps
+        self.num_written = 0
+        self.num_dropped = 0
+        self.output_path = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._writer = None
+
+    def start(self):
+        """ライタースレッドを開始"""
+        localtime = time.strftime("%Y%m%d%H%M%S", time.localtime())
+        os.makedirs(self.save_dir, exist_ok=True)
+        if self.format == "video":
+            self.output_path = os.path.join(self.save_dir, f"snap_{localtime}.mp4")
+        else:
+            self.output_path = os.path.join(self.save_dir, f"snap_{localtime}")
+            os.makedirs(self.output_path, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="SnapRecorder", daemon=True)
+        self._thread.start()
+
+    def push(self, frame:np.ndarray, step:int) -> bool:
+        """
+        フレームをキューに追加（ブロックしない）
+        frame: 0.0〜1.0のfloat画像 (H, W)
+        step: 学習ステップ
+        return: 追加できた場合True、キュー満杯で破棄した場合False
+        """
+        try:
+            self._queue.put_nowait((step, frame))
+            return True
+        except queue.Full:
+            self.num_dropped += 1
+            return False
+
+    def stop(self, timeout:float=10.0):
+        """
+        残りのフレームを書き出してライタースレッドを終了
+        timeout: スレッド終了の待ち時間[秒]
+        """
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            print("[SnapRecorder] キューが空かないため終了通知に失敗しました")
+        self._thread.join(timeout=timeout)
+        self._thread = None
+        print(f"[SnapRecorder] 完了: {self.output_path} (書出し {self.num_written}, 破棄 {self.num_dropped})")
+
+    def _run(self):
+        """ライタースレッドの本体"""
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                step, frame = item
+                try:
+                    self._write(step, frame)
+                    self.num_written += 1
+                except Exception as e:
+                    print(f"[SnapRecorder] 書出しエラー: {str(e)}")
+        finally:
+            if self._writer is not None:
+                self._writer.release()
+                self._writer = None
+
+    def _write(self, step:int, frame:np.ndarray):
+        """
+        フレームを1枚書き出す
+        step: 学習ステップ
+        frame: 0.0〜1.0のfloat画像 (H, W)
+        """
+        img_uint8 = (np.clip(frame, 0, 1) * 255).astype(np.uint8)
+        if self.format == "images":
+            cv2.imwrite(os.path.join(self.output_path, f"{step:08d}.png"), img_uint8)
+            return
+
+        # 動画ライターは最初のフレームのサイズで作成
+        img_bgr = cv2.cvtColor(img_uint8, cv2.COLOR_GRAY2BGR)
+        if self._writer is None:
+            height, width = img_uint8.shape
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            self._writer = cv2.VideoWriter(self.output_path, fourcc, self.fps, (width, height))
+            if not self._writer.isOpened():
+                raise IOError(f"動画ファイルを作成できません: {self.output_path}")
+        self._writer.write(img_bgr)
+
+
+if __name__ == "__main__":
+    import tempfile
+    recorder = SnapRecorder(tempfile.mkdtemp(), format="video", max_queue=4)
+    recorder.start()
+    for step in range(100):
+        recorder.push(np.random.rand(250, 200).astype(np.float32), step)
+    recorder.stop()
+    print("SnapRecorder test OK")
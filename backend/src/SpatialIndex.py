@@ -0,0 +1,215 @@
+import numpy as np
+
+class SpatialIndex:
+    """
+    ガウシアンの空間インデックス（一様グリッド）
+    note:
+      各ガウシアンを、分散共分散行列から求めた楕円の外接矩形（k sigma）が重なるセルに登録する。
+      更新時は外接矩形のセル範囲が変わったガウシアンだけを登録し直す。
+    """
+    _CELL_SIZE:int = 16          # デフォルト値：セルの一辺[px]
+    _NUM_SIGMA:float = 3.0       # デフォルト値：外接矩形に含める範囲[sigma]
+    _REBUILD_RATIO:float = 0.25  # 変更されたガウシアンの割合がこれを超えたら全体を作り直す
+    _MIN_VARIANCE:float = 1e-4     # 分散の下限（GaussianSplatting2Dと同じ値）
+    _MAX_CORRELATION:float = 0.99  # 相関係数の絶対値の上限（GaussianSplatting2Dと同じ値）
+
+    def __init__(self, width:int, height:int, cell_size:int=_CELL_SIZE, num_sigma:float=_NUM_SIGMA):
+        """
+        コンストラクタ
+        width: 画像幅
+        height: 画像高さ
+        cell_size: セルの一辺[px]
+        num_sigma: 外接矩形に含める範囲[sigma]
+        """
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.num_sigma = num_sigma
+        self.grid_w = max(1, -(-width // cell_size))
+        self.grid_h = max(1, -(-height // cell_size))
+        self.means = np.zeros((0, 2), dtype=np.float32)
+        self.cov = np.zeros((0, 3), dtype=np.float32)   # [var_x, var_y, cov_xy]
+        self.weights = np.zeros(0, dtype=np.float32)
+        self.bboxes = np.zeros((0, 4), dtype=np.float32)
+        self._cell_ranges = np.zeros((0, 4), dtype=np.int64)
+        self._cells = [set() for _ in range(self.grid_w * self.grid_h)]
+
+    @staticmethod
+    def covariance_from_sigmas(sigmas:np.ndarray) -> np.ndarray:
+        """
+        sigmasパラメタから分散共分散行列の要素を計算（_gaussian_2d_batchと同じ計算）
+        sigmas: (N, 3) [sigma_x, sigma_y, sigma_xy] または (N, 2) [sigma_x, sigma_y]
+        return: (N, 3) [var_x, var_y, cov_xy]
+        """
+        var_x = np.square(sigmas[:, 0])
+        var_y = np.square(sigmas[:, 1])
+        if sigmas.shape[1] == 3:
+            var_x = var_x + SpatialIndex._MIN_VARIANCE
+            var_y = var_y + SpatialIndex._MIN_VARIANCE
+            threshold = SpatialIndex._MAX_CORRELATION * np.sqrt(var_x * var_y)
+            cov_xy = np.minimum(np.maximum(sigmas[:, 2], -threshold), threshold)
+        else:
+            cov_xy = np.zeros_like(var_x)
+        return np.column_stack([var_x, var_y, cov_xy]).astype(np.float32)
+
+    def refresh(self, params:dict):
+        """
+        インデックスを更新
+        params: {'means': (N, 2), 'sigmas': (N, 3) or (N, 2), 'weights': (N,)}
+        """
+        means = params['means'].astype(np.float32)
+        cov = SpatialIndex.covariance_from_sigmas(params['sigmas'])
+        half = self.num_sigma * np.sqrt(np.maximum(cov[:, :2], 0))
+        bboxes = np.column_stack([means - half, means + half])
+        ranges = self._to_cell_ranges(bboxes)
+
+        if len(ranges) != len(self._cell_ranges):
+            changed = None
+        else:
+            changed = np.flatnonzero(np.any(ranges != self._cell_ranges, axis=1))
+
+        self.means, self.cov, self.weights, self.bboxes = means, cov, params['weights'].astype(np.float32), bboxes
+        if changed is None or len(changed) > SpatialIndex._REBUILD_RATIO * len(ranges):
+            self._rebuild(ranges)
+        else:
+            for idx in changed:
+                self._unregister(idx, self._cell_ranges[idx])
+                self._register(idx, ranges[idx])
+            self._cell_ranges = ranges
+
+    def _to_cell_ranges(self, bboxes:np.ndarray) -> np.ndarray:
+        """
+        外接矩形をセル範囲に変換（画像外はグリッド端に丸める）
+        bboxes: (N, 4) [x0, y0, x1, y1]
+        return: (N, 4) [cx0, cy0, cx1, cy1]（両端を含む）
+        """
+        cells = np.floor(bboxes / self.cell_size).astype(np.int64)
+        cells[:, [0, 2]] = cells[:, [0, 2]].clip(0, self.grid_w - 1)
+        cells[:, [1, 3]] = cells[:, [1, 3]].clip(0, self.grid_h - 1)
+        return cells
+
+    def _rebuild(self, ranges:np.ndarray):
+        """
+        インデックス全体を作り直す
+        ranges: (N, 4) のセル範囲
+        """
+        self._cells = [set() for _ in range(self.grid_w * self.grid_h)]
+        for idx, cell_range in enumerate(ranges):
+            self._register(idx, cell_range)
+        self._cell_ranges = ranges
+
+    def _register(self, idx:int, cell_range:np.ndarray):
+        """ガウシアンをセル範囲に登録"""
+        cx0, cy0, cx1, cy1 = cell_range
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                self._cells[cy * self.grid_w + cx].add(idx)
+
+    def _unregister(self, idx:int, cell_range:np.ndarray):
+        """ガウシアンをセル範囲から削除"""
+        cx0, cy0, cx1, cy1 = cell_range
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                self._cells[cy * self.grid_w + cx].discard(idx)
+
+    def _candidates(self, cx0:int, cy0:int, cx1:int, cy1:int) -> np.ndarray:
+        """セル範囲に登録されたガウシアンのインデックスを取得"""
+        found = set()
+        for cy in range(max(cy0, 0), min(cy1, self.grid_h - 1) + 1):
+            for cx in range(max(cx0, 0), min(cx1, self.grid_w - 1) + 1):
+                found.update(self._cells[cy * self.grid_w + cx])
+        return np.fromiter(found, dtype=np.int64, count=len(found))
+
+    def _cell_of(self, x:float, y:float) -> tuple:
+        """座標を含むセル（グリッド端に丸める）"""
+        cx = min(max(int(x // self.cell_size), 0), self.grid_w - 1)
+        cy = min(max(int(y // self.cell_size), 0), self.grid_h - 1)
+        return cx, cy
+
+    def query_region(self, x0:float, y0:float, x1:float, y1:float) -> np.ndarray:
+        """
+        矩形領域に外接矩形が重なるガウシアンを取得
+        x0, y0, x1, y1: 矩形領域
+        return: ガウシアンのインデックス（昇順）
+        """
+        cx0, cy0 = self._cell_of(min(x0, x1), min(y0, y1))
+        cx1, cy1 = self._cell_of(max(x0, x1), max(y0, y1))
+        idx = self._candidates(cx0, cy0, cx1, cy1)
+        boxes = self.bboxes[idx]
+        hit = (boxes[:, 0] <= max(x0, x1)) & (boxes[:, 2] >= min(x0, x1)) & \
+              (boxes[:, 1] <= max(y0, y1)) & (boxes[:, 3] >= min(y0, y1))
+        return np.sort(idx[hit])
+
+    def query_nearest(self, x:float, y:float, k:int=1) -> np.ndarray:
+        """
+        中心が近い順にk個のガウシアンを取得
+        note: 注目セルから外側へリング状に探索し、k番目の距離が探索済み範囲に収まったら終了する
+        x, y: 座標
+        k: 取得数
+        return: ガウシアンのインデックス（近い順）
+        """
+        num = len(self.means)
+        k = min(k, num)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+
+        cx, cy = self._cell_of(x, y)
+        max_ring = max(self.grid_w, self.grid_h)
+        point = np.array([x, y], dtype=np.float32)
+        for ring in range(max_ring + 1):
+            idx = self._candidates(cx - ring, cy - ring, cx + ring, cy + ring)
+            idx = idx[self._mean_in_cells(idx, cx - ring, cy - ring, cx + ring, cy + ring)]
+            if len(idx) < k and ring < max_ring:
+                continue
+            dist = np.linalg.norm(self.means[idx] - point, axis=1)
+            order = np.argsort(dist, kind='stable')[:k]
+            # 最後のリングは全セルを含むため必ず終了する
+            if dist[order[-1]] <= ring * self.cell_size or ring == max_ring:
+                return idx[order]
+
+    def _mean_in_cells(self, idx:np.ndarray, cx0:int, cy0:int, cx1:int, cy1:int) -> np.ndarray:
+        """中心座標のセル（グリッド端に丸める）がセル範囲内にあるか"""
+        cells = np.floor(self.means[idx] / self.cell_size).astype(np.int64)
+        cells[:, 0] = cells[:, 0].clip(0, self.grid_w - 1)
+        cells[:, 1] = cells[:, 1].clip(0, self.grid_h - 1)
+        return (cells[:, 0] >= cx0) & (cells[:, 0] <= cx1) & (cells[:, 1] >= cy0) & (cells[:, 1] <= cy1)
+
+    def query_pick(self, x:float, y:float, min_contribution:float=0.0) -> tuple:
+        """
+        画素に寄与するガウシアンを寄与の大きい順に取得
+        x, y: 画素の座標
+        min_contribution: これ以下の寄与は除外する
+        return: (インデックス, 寄与) 寄与 = weight * 正規分布の確率密度
+        """
+        idx = self._candidates(*self._cell_of(x, y), *self._cell_of(x, y))
+        boxes = self.bboxes[idx]
+        idx = idx[(boxes[:, 0] <= x) & (boxes[:, 2] >= x) & (boxes[:, 1] <= y) & (boxes[:, 3] >= y)]
+
+        var_x, var_y, cov_xy = self.cov[idx, 0], self.cov[idx, 1], self.cov[idx, 2]
+        det = np.maximum(var_x * var_y - cov_xy ** 2, 1e-12)
+        dx, dy = x - self.means[idx, 0], y - self.means[idx, 1]
+        mahalanobis = (var_y * dx ** 2 - 2 * cov_xy * dx * dy + var_x * dy ** 2) / det
+        contribution = self.weights[idx] * np.exp(-0.5 * mahalanobis) / (2 * np.pi * np.sqrt(det))
+
+        keep = np.abs(contribution) > min_contribution
+        order = np.argsort(-np.abs(contribution[keep]), kind='stable')
+        return idx[keep][order], contribution[keep][order]
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    params = {
+        'means': rng.random((1000, 2), dtype=np.float32) * [200, 250],
+        'sigmas': np.column_stack([np.ones((1000, 2)) * 5.0, np.zeros(1000)]).astype(np.float32),
+        'weights': rng.random(1000, dtype=np.float32)
+    }
+    index = SpatialIndex(200, 250)
+    index.refresh(params)
+    print(f"region: {len(index.query_region(50, 50, 80, 80))}")
+    nearest = index.query_nearest(100, 100, k=5)
+    brute = np.argsort(np.linalg.norm(params['means'] - [100, 100], axis=1))[:5]
+    print(f"nearest: {nearest} (brute force: {brute})")
+    params['means'][:10] += 30
+    index.refresh(params)
+    print(f"pick: {index.query_pick(100, 100)[0][:5]}")
+    print("SpatialIndex test OK")
@@ -0,0 +1,224 @@
+import os, math, asyncio, importlib
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+
+_stop_event = None   # 中断要求（ワーカープロセスごとに_init_workerで設定）
+
+def _init_worker(stop_event):
+    """
+    ワーカープロセスの初期化。プロセス数分の並列化を優先し、各プロセスのスレッド数は1にする
+    stop_event: 中断要求のイベント（親プロセスと共有）
+    """
+    global _stop_event
+    import torch
+    torch.set_num_threads(1)
+    _stop_event = stop_event
+
+async def _watch_stop(gs, interval:float=0.1):
+    """
+    中断要求を監視し、要求があれば学習を中断させる
+    gs: 学習中のインスタンス
+    interval: 監視間隔[s]
+    """
+    while not _stop_event.is_set():
+        await asyncio.sleep(interval)
+    gs.should_stop = True
+
+async def _calculate_until_stopped(gs, **kwargs):
+    """
+    中断要求を監視しながら学習する
+    gs: 学習するインスタンス
+    kwargs: calculate_asyncの引数
+    """
+    watcher = asyncio.create_task(_watch_stop(gs))
+    try:
+        await gs.calculate_async(**kwargs)
+    finally:
+        watcher.cancel()
+
+def _fit_tile_worker(class_name:str, tile:np.ndarray, num_gaussians:int, num_steps:int,
+                     opt_lr:float, loss_func_name:str) -> dict:
+    """
+    タイル1枚を学習する（ワーカープロセスで実行）
+    class_name: 学習に使うクラス名（モジュール名と同じ）
+    tile: タイル画像 (h, w) uint8
+    num_gaussians: タイルあたりのガウシアン点の数
+    num_steps: 学習ステップ数
+    opt_lr: 学習率
+    loss_func_name: 誤差計算用の関数名
+    return: タイル座標系のガウシアンパラメタ(numpy配列のdict)
+    """
+    import torch
+    class_object = getattr(importlib.import_module(class_name), class_name)
+    height, width = tile.shape
+    # 複数プロセスで並列に動かすため、GPUがあってもCPUで計算する（各プロセスがGPUメモリを奪い合わないように）
+    gs = class_object(device="cpu")
+    gs.initialize(Image.fromarray(tile), resize_w=width, resize_h=height, num_gaussians=num_gaussians)
+    # 中断要求を受け付けるため、一定ステップごとにイベントループに制御を返す
+    asyncio.run(_calculate_until_stopped(gs, num_steps=num_steps, opt_lr=opt_lr,
+                                         loss_func_name=loss_func_name,
+                                         update_interval=TileFitter._UPDATE_INTERVAL))
+
+    # 学習時は予測画像を最大値で正規化しているため、重みを最大値で割って絶対輝度に戻す
+    params = gs.get_params_numpy()
+    with torch.no_grad():
+        scale = gs._generate_unnormalized_image().max().item()
+    params['weights'] = params['weights'] / scale
+    return params
+
+class TileFitter:
+    """
+    大きな画像のタイル分割学習
+    note:
+      画像を重なりのあるタイルに分割し、タイルごとにプロセスプールで並列に学習する（各プロセスはCPUで計算）。
+      結果は重なり領域で重みを線形に減衰させる（和が1になる）ことで継ぎ目なく1つのパラメタ集合に統合する。
+      描画は全画素×全ガウシアンの密な計算のため、既定設定(256px, 500点)で1ワーカーあたり約2GBのメモリを使う。
+      並列数の既定値はコア数・空きメモリ・_MAX_WORKERSの最小値とする。
+    """
+    _TILE_SIZE:int = 256           # デフォルト値：タイルの一辺[px]
+    _OVERLAP:int = 32              # デフォルト値：タイルの重なり幅[px]
+    _GAUSSIANS_PER_TILE:int = 500  # デフォルト値：タイルあたりのガウシアン点の数
+    _NUM_STEPS:int = 2000          # デフォルト値：タイルあたりの学習ステップ数
+    _MAX_WORKERS:int = 4           # デフォルト値：並列プロセス数の上限
+    _WORKER_MEMORY:int = 2 << 30   # 1ワーカーあたりのメモリ使用量の目安[byte]（既定設定で実測約1.9GB）
+    _UPDATE_INTERVAL:int = 100     # ワーカーがイベントループに制御を返すステップ間隔（中断要求の確認用）
+    _MIN_BLEND:float = 1e-3        # 統合時の重み係数がこれ未満のガウシアンは捨てる
+
+    def __init__(self, class_name:str="GaussianSplatting2D", tile_size:int=_TILE_SIZE,
+                 overlap:int=_OVERLAP, max_workers:int=None):
+        """
+        コンストラクタ
+        class_name: 学習に使うクラス名
+        tile_size: タイルの一辺[px]
+        overlap: タイルの重なり幅[px]
+        max_workers: 並列プロセス数（Noneならコア数・空きメモリ・_MAX_WORKERSから決める）
+        """
+        if not 0 <= overlap < tile_size:
+            raise ValueError(f"重なり幅はタイルサイズ未満にしてください: tile_size={tile_size}, overlap={overlap}")
+        self.class_name = class_name
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.max_workers = max_workers or self._default_workers()
+        self._stop_event = mp.get_context("spawn").Event()
+
+    @staticmethod
+    def _default_workers() -> int:
+        """
+        並列プロセス数の既定値を計算
+        return: コア数・空きメモリから見積もった数・_MAX_WORKERSの最小値（1以上）
+        """
+        num = min(os.cpu_count() or 1, TileFitter._MAX_WORKERS)
+        try:
+            available = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+            num = min(num, available // TileFitter._WORKER_MEMORY)
+        except (ValueError, OSError, AttributeError):
+            # 空きメモリを取得できない環境では上限値のみで制限する
+            pass
+        return max(int(num), 1)
+
+    def stop(self):
+        """学習中のタイルに中断を要求する（中断したタイルはその時点の結果を使う）"""
+        self._stop_event.set()
+
+    def _tile_starts(self, length:int) -> list:
+        """
+        1軸方向のタイル開始位置を計算
+        length: 画像の幅または高さ
+        return: 開始位置のリスト（両端のタイルは画像端に揃える）
+        """
+        if length <= self.tile_size:
+            return [0]
+        stride = self.tile_size - self.overlap
+        num_tiles = math.ceil((length - self.overlap) / stride)
+        return [round(v) for v in np.linspace(0, length - self.tile_size, num_tiles)]
+
+    def _blend_weights(self, positions:np.ndarray, starts:list, length:int) -> np.ndarray:
+        """
+        1軸方向のブレンド係数を計算
+        note: 各タイル内側の重なり部分で線形に減衰させ、全タイルの和が1になるよう正規化する
+        positions: ガウシアン中心の座標 (N,)
+        starts: タイル開始位置のリスト
+        length: 画像の幅または高さ
+        return: (タイル数, N) のブレンド係数
+        """
+        tile = min(self.tile_size, length)
+        pos = np.clip(positions, 0, length - 1)
+        ramps = []
+        for idx, start in enumerate(starts):
+            ramp = ((pos >= start) & (pos < start + tile)).astype(np.float64)
+            if idx > 0:
+                width = starts[idx - 1] + tile - start
+                ramp = np.minimum(ramp, np.clip((pos - start) / max(width, 1), 0, 1))
+            if idx < len(starts) - 1:
+                width = start + tile - starts[idx + 1]
+                ramp = np.minimum(ramp, np.clip((start + tile - pos) / max(width, 1), 0, 1))
+            ramps.append(ramp)
+        ramps = np.stack(ramps)
+        return ramps / np.maximum(ramps.sum(axis=0, keepdims=True), 1e-12)
+
+    async def fit(self, image:Image, num_gaussians:int=_GAUSSIANS_PER_TILE, num_steps:int=_NUM_STEPS,
+                  opt_lr:float=0.01, loss_func_name:str="_calc_loss_l1_ssim") -> dict:
+        """
+        画像をタイル分割して学習し、1つのパラメタ集合に統合
+        image: 入力画像（リサイズせずに使う）
+        num_gaussians: タイルあたりのガウシアン点の数
+        num_steps: タイルあたりの学習ステップ数
+        opt_lr: 学習率
+        loss_func_name: 誤差計算用の関数名
+        return: 画像全体の座標系のガウシアンパラメタ(numpy配列のdict)
+        """
+        # 大きな画像のデコードでイベントループを止めない
+        img = await asyncio.to_thread(lambda: np.array(image.convert('L')))
+        height, width = img.shape
+        xs = self._tile_starts(width)
+        ys = self._tile_starts(height)
+        tw, th = min(self.tile_size, width), min(self.tile_size, height)
+        tiles = [(x, y) for y in ys for x in xs]
+        print(f"[TileFitter] 開始: image={width}x{height}, tiles={len(xs)}x{len(ys)}, workers={self.max_workers}")
+
+        # タイルごとに並列学習（CUDAと共存できるようspawnで起動）
+        self._stop_event.clear()
+        loop = asyncio.get_running_loop()
+        executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=mp.get_context("spawn"),
+                                       initializer=_init_worker, initargs=(self._stop_event,))
+        completed = False
+        try:
+            futures = [loop.run_in_executor(executor, _fit_tile_worker, self.class_name,
+                                            np.ascontiguousarray(img[y:y + th, x:x + tw]),
+                                            num_gaussians, num_steps, opt_lr, loss_func_name)
+                       for x, y in tiles]
+            results = await asyncio.gather(*futures)
+            completed = True
+        finally:
+            if not completed:
+                # エラー・キャンセル時は実行中のタイルも中断させる
+                self._stop_event.set()
+            # 終了待ちでイベントループを止めない
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        # 画像全体の座標系に変換し、重なり部分をブレンドして統合
+        merged = {key: [] for key in results[0].keys()}
+        for (x, y), params in zip(tiles, results):
+            means = params['means'] + np.array([x, y], dtype=np.float32)
+            blend = self._blend_weights(means[:, 0], xs, width)[xs.index(x)] * \
+                    self._blend_weights(means[:, 1], ys, height)[ys.index(y)]
+            keep = blend >= TileFitter._MIN_BLEND
+            params['means'] = means
+            params['weights'] = params['weights'] * blend.astype(np.float32)
+            for key, value in params.items():
+                merged[key].append(value[keep])
+        merged = {key: np.concatenate(values) for key, values in merged.items()}
+        print(f"[TileFitter] 完了: num_gaussians={len(merged['weights'])}")
+        return merged
+
+
+if __name__ == "__main__":
+    from ImageManager import ImageManager
+
+    pil_image = ImageManager.open_from_filepath('/mnt/project/testdata/sample1.png')
+    fitter = TileFitter(tile_size=128, overlap=16)
+    params = asyncio.run(fitter.fit(pil_image, num_gaussians=100, num_steps=200))
+    print({key: value.shape for key, value in params.items()})
+    print("TileFitter test OK")
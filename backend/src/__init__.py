@@ -5,3 +5,10 @@ from . import GaussianParam
 from . import GaussianParamsList
 from . import GaussianSplatting2D
 from . import GaussianSplatting2D_only_variance
+from . import SnapRecorder
+from . import SequenceFitter
+from . import TileFitter
+from . import ParamCodec
+from . import SpatialIndex
+from . import ProgressChannel
+from . import LevelOfDetail
@@ -1,17 +1,21 @@
-import os
-from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
+import os, time
+import asyncio, threading, importlib, uuid
+from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import json
-from typing import Optional, List
-from ImageManager import ImageManager
+import json, base64
+from typing import Optional, List, TYPE_CHECKING
 from GaussianParam import GaussianParamsList
-from GaussianSplatting2D import GaussianSplatting2D
-from GaussianSplatting2D_only_variance import GaussianSplatting2D_only_variance
+from ProgressChannel import ProgressChannel, ProgressSubscriber
+# torch, cv2等に依存するモジュールは起動を速くするため初回利用時に読み込む
+if TYPE_CHECKING:
+    from GaussianSplatting2D import GaussianSplatting2D
 
 # Global
 APP_VERSION = "1.0.0"
 app = FastAPI(title="2dgs_API", version=APP_VERSION)
+SNAP_SAVE_DIR = os.environ.get('SNAP_SAVE_DIR')  # 録画の保存先（未設定なら録画しない）
 
 # CORS設定
 cor_origins = os.environ['CORS_ALLOWED_ORIGINS']
@@ -22,18 +26,88 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Num-Gaussians", "X-Reconstruction-MSE", "X-Reconstruction-PSNR"],
 )
 
 # グローバル変数
-gs_instance: Optional[GaussianSplatting2D] = None
+gs_instance: Optional["GaussianSplatting2D"] = None
 is_processing = False
 should_stop = False
+jobs: dict = {}                      # 学習ジョブID -> 経過配信チャネル
+current_job_id: Optional[str] = None
+tile_fitter = None                   # 実行中のタイル分割学習（/stopで中断するため）
 
 class GSParams(BaseModel):
     num_gaussians: int = 1000
     learning_rate: float = 0.01
     num_steps: int = 10000
 
+# 処理方法のクラス名（モジュール名と同じ）
+GS_CLASS_NAMES = ("GaussianSplatting2D", "GaussianSplatting2D_only_variance")
+device_cache: Optional[dict] = None
+warmup_state = "disabled"
+
+def _get_class(class_name: str) -> type:
+    """
+    処理方法のクラスを取得（モジュールは初回利用時に読み込む）
+    class_name: クラス名
+    """
+    if class_name not in GS_CLASS_NAMES:
+        raise ValueError(f"クラス名 '{class_name}' は見つからないか、クラスではありません。")
+    return getattr(importlib.import_module(class_name), class_name)
+
+def _warmup():
+    """重いモジュールの読み込みと計算処理の初回実行を済ませておく（バックグラウンドスレッドで実行）"""
+    global warmup_state
+    warmup_state = "running"
+    try:
+        start_time = time.perf_counter()
+        from PIL import Image
+        from ImageManager import ImageManager
+        for class_name in GS_CLASS_NAMES:
+            _get_class(class_name)
+        gs = _get_class("GaussianSplatting2D")()
+        gs.initialize(Image.new('L', (32, 32)), resize_w=32, resize_h=32, num_gaussians=4)
+        asyncio.run(gs.calculate_async(num_steps=2, update_interval=2))
+        ImageManager.cv2_to_base64(gs.generate_current_images()["points"])
+        warmup_state = "done"
+        print(f"[Warmup] 完了: {time.perf_counter() - start_time:.2f}秒")
+    except Exception as e:
+        warmup_state = "failed"
+        print(f"[Warmup] エラー: {str(e)}")
+
+@app.on_event("startup")
+async def startup():
+    """起動処理。リクエスト受付を待たせないよう、ウォームアップは別スレッドで行う"""
+    global warmup_state
+    if os.environ.get('WARMUP', '1') == '1':
+        warmup_state = "pending"
+        threading.Thread(target=_warmup, name="Warmup", daemon=True).start()
+
+def _params_to_list(params: dict, indices=None) -> list:
+    """
+    ガウシアンパラメタ(numpy配列のdict)をフロントエンド用のdictのリストに変換
+    params: {'means': (N, 2), 'sigmas': (N, 3) or (N, 2), 'weights': (N,)}
+    indices: 変換するガウシアンのインデックス（Noneなら全て）
+    """
+    means, sigmas, weights = params['means'], params['sigmas'], params['weights']
+    has_covariance = sigmas.shape[1] == 3
+    params_list = []
+    for i in (range(len(means)) if indices is None else indices):
+        i = int(i)
+        param = {
+            "index": i,
+            "mean_x": float(means[i, 0]),
+            "mean_y": float(means[i, 1]),
+            "sigma_x": float(sigmas[i, 0]),
+            "sigma_y": float(sigmas[i, 1]),
+            "weight": float(weights[i])
+        }
+        if has_covariance:
+            param["sigma_xy"] = float(sigmas[i, 2])
+        params_list.append(param)
+    return params_list
+
 @app.get("/")
 async def root():
     return {"status": "service available",
@@ -43,19 +117,32 @@ async def root():
 @app.get("/health")
 async def health():
     """ヘルスチェック用エンドポイント"""
-    return root()
+    return await root()
 
-@app.get("/device-info")
-async def device_info():
-    """デバイス情報取得"""
-    global gs_instance
-    gs_tmp = gs_instance if gs_instance is not None else GaussianSplatting2D()
-    device = gs_tmp.get_processer()
+@app.get("/ready")
+async def ready(require_warm: bool = False):
+    """レディネスチェック用エンドポイント（モデルは作成しない）"""
+    if require_warm and warmup_state not in ("done", "disabled"):
+        raise HTTPException(status_code=503, detail=f"ウォームアップ中です: {warmup_state}")
+    return {"status": "ready", "warmup": warmup_state}
+
+def _get_device_info() -> dict:
+    """デバイス情報を取得（モデルは作成しない）"""
+    device = _get_class("GaussianSplatting2D").get_processer()
     return {
         "device": "GPU" if device.type == "cuda" else "CPU",
         "device_name": str(device)
     }
 
+@app.get("/device-info")
+async def device_info():
+    """デバイス情報取得"""
+    global device_cache
+    if device_cache is None:
+        # torchの読み込み中もイベントループを止めない
+        device_cache = await asyncio.to_thread(_get_device_info)
+    return device_cache
+
 @app.get("/get-params")
 async def get_params():
     """現在のガウシアンパラメータを取得"""
@@ -65,40 +152,132 @@ async def get_params():
         raise HTTPException(status_code=400, detail="GaussianSplattingが初期化されていません")
     
     try:
-        means = gs_instance.params['means'].cpu().detach().numpy()
-        sigmas = gs_instance.params['sigmas'].cpu().detach().numpy()
-        weights = gs_instance.params['weights'].cpu().detach().numpy()
-        
-        # 共分散ありかなしかを判定
-        has_covariance = sigmas.shape[1] == 3
-        
-        params_list = []
-        for i in range(len(means)):
-            param = {
-                "index": i,
-                "mean_x": float(means[i, 0]),
-                "mean_y": float(means[i, 1]),
-                "sigma_x": float(sigmas[i, 0]),
-                "sigma_y": float(sigmas[i, 1]),
-                "weight": float(weights[i])
-            }
-            if has_covariance:
-                param["sigma_xy"] = float(sigmas[i, 2])
-            params_list.append(param)
-        
+        params = gs_instance.get_params_numpy()
         return {
-            "num_gaussians": len(means),
-            "has_covariance": has_covariance,
-            "params": params_list
+            "num_gaussians": len(params['means']),
+            "has_covariance": params['sigmas'].shape[1] == 3,
+            "params": _params_to_list(params)
         }
         
     except Exception as e:
         print(f"[GetParams] エラー: {str(e)}")
         raise HTTPException(status_code=500, detail=f"パラメータ取得エラー: {str(e)}")
 
+def _get_spatial_index():
+    """空間インデックスと現在のパラメタを取得"""
+    global gs_instance
+    
+    if gs_instance is None or gs_instance.params is None:
+        raise HTTPException(status_code=400, detail="GaussianSplattingが初期化されていません")
+    return gs_instance.get_spatial_index(), gs_instance.get_params_numpy()
+
+@app.get("/spatial/region")
+async def spatial_region(x0: float, y0: float, x1: float, y1: float):
+    """矩形領域に重なるガウシアンパラメタを取得"""
+    index, params = _get_spatial_index()
+    indices = index.query_region(x0, y0, x1, y1)
+    return {
+        "num_gaussians": len(params['weights']),
+        "count": len(indices),
+        "params": _params_to_list(params, indices)
+    }
+
+@app.get("/spatial/nearest")
+async def spatial_nearest(x: float, y: float, k: int = 1):
+    """中心が指定座標に近い順にk個のガウシアンパラメタを取得"""
+    index, params = _get_spatial_index()
+    indices = index.query_nearest(x, y, k)
+    return {
+        "num_gaussians": len(params['weights']),
+        "count": len(indices),
+        "params": _params_to_list(params, indices)
+    }
+
+@app.get("/spatial/pick")
+async def spatial_pick(x: float, y: float, min_contribution: float = 0.0):
+    """指定画素に寄与するガウシアンパラメタを寄与の大きい順に取得"""
+    index, params = _get_spatial_index()
+    indices, contributions = index.query_pick(x, y, min_contribution)
+    params_list = _params_to_list(params, indices)
+    for param, contribution in zip(params_list, contributions):
+        param["contribution"] = float(contribution)
+    return {
+        "num_gaussians": len(params['weights']),
+        "count": len(indices),
+        "params": params_list
+    }
+
+@app.get("/stream-params")
+async def stream_params(format: str = "ndjson",
+                        base_fraction: float = 0.02,
+                        growth: float = 2.0):
+    """
+    ガウシアンパラメタを寄与度の大きい順にレイヤ分割して段階的に送信
+    format: "ndjson"（1行1レイヤのJSON）または "binary"（4バイト長 + ParamCodec形式のレイヤの繰り返し）
+    """
+    from LevelOfDetail import LevelOfDetail
+    from ParamCodec import ParamCodec
+    global gs_instance
+    
+    if gs_instance is None or gs_instance.params is None:
+        raise HTTPException(status_code=400, detail="GaussianSplattingが初期化されていません")
+    if format not in ("ndjson", "binary"):
+        raise HTTPException(status_code=400, detail=f"サポートされていない形式: {format}")
+    
+    try:
+        # 送信中に学習が進んでも一貫するよう、この時点のパラメタを使う
+        params = gs_instance.get_params_numpy()
+        layers = LevelOfDetail.build_layers(gs_instance.get_contribution_order(),
+                                            base_fraction=base_fraction, growth=growth)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    print(f"[StreamParams] 開始: format={format}, layers={[len(layer) for layer in layers]}")
+    
+    def generate():
+        for idx, indices in enumerate(layers):
+            if format == "binary":
+                layer_params = {key: value[indices] for key, value in params.items()}
+                data = ParamCodec.encode(layer_params)
+                yield len(data).to_bytes(4, "little") + data
+            else:
+                yield json.dumps({
+                    "layer": idx,
+                    "num_layers": len(layers),
+                    "num_gaussians": len(params['weights']),
+                    "params": _params_to_list(params, indices)
+                }) + "\n"
+    
+    media_type = "application/octet-stream" if format == "binary" else "application/x-ndjson"
+    return StreamingResponse(generate(), media_type=media_type)
+
+@app.get("/preview")
+async def preview(top_k: int):
+    """寄与度の大きい上位top_k個のガウシアンだけで推論画像を生成"""
+    from ImageManager import ImageManager
+    global gs_instance
+    
+    if gs_instance is None or gs_instance.params is None:
+        raise HTTPException(status_code=400, detail="GaussianSplattingが初期化されていません")
+    if top_k <= 0:
+        raise HTTPException(status_code=400, detail="top_kは1以上を指定してください")
+    
+    try:
+        images = gs_instance.generate_current_images(top_k=top_k)
+        return {
+            "status": "preview",
+            "top_k": min(top_k, gs_instance.num_gaussians),
+            "predicted_image": ImageManager.cv2_to_base64(images["predicted"]),
+            "points_image": ImageManager.cv2_to_base64(images["points"])
+        }
+        
+    except Exception as e:
+        print(f"[Preview] エラー: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"プレビュー生成エラー: {str(e)}")
+
 @app.post("/update-params")
 async def update_params(update_data: GaussianParamsList):
     """ガウシアンパラメータを更新"""
+    from ImageManager import ImageManager
     global gs_instance
     
     if gs_instance is None or gs_instance.params is None:
@@ -123,34 +302,105 @@ async def update_params(update_data: GaussianParamsList):
         print(f"[UpdateParams] エラー: {str(e)}")
         raise HTTPException(status_code=500, detail=f"パラメータ更新エラー: {str(e)}")
 
+@app.get("/export-params")
+async def export_params(mode: str = "quantized",
+                        bits: int = 16,
+                        compress: bool = True,
+                        spatial_sort: bool = True,
+                        report_error: bool = True):
+    """現在のガウシアンパラメタをコンパクトなバイナリ形式で取得"""
+    import numpy as np
+    from ParamCodec import ParamCodec
+    global gs_instance
+    
+    if gs_instance is None or gs_instance.params is None:
+        raise HTTPException(status_code=400, detail="GaussianSplattingが初期化されていません")
+    
+    try:
+        params = gs_instance.get_params_numpy()
+        data = ParamCodec.encode(params, mode=mode, bits=bits,
+                                 compress=compress, spatial_sort=spatial_sort)
+        headers = {"X-Num-Gaussians": str(len(params['weights']))}
+        
+        # 量子化後のパラメタで描画した画像の誤差
+        if report_error:
+            img_org = gs_instance.render_params_numpy(params)
+            img_dec = gs_instance.render_params_numpy(ParamCodec.decode(data))
+            mse = float(np.mean((img_org - img_dec) ** 2))
+            psnr = float("inf") if mse == 0 else float(10 * np.log10(1.0 / mse))
+            headers["X-Reconstruction-MSE"] = f"{mse:.6e}"
+            headers["X-Reconstruction-PSNR"] = f"{psnr:.2f}"
+        print(f"[ExportParams] 完了: mode={mode}, bits={bits}, bytes={len(data)}")
+        
+        return Response(content=data, media_type="application/octet-stream", headers=headers)
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"[ExportParams] エラー: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"パラメータ出力エラー: {str(e)}")
+
+@app.post("/import-params")
+async def import_params(file: UploadFile = File(...)):
+    """バイナリ形式のガウシアンパラメタを読み込み"""
+    from ImageManager import ImageManager
+    from ParamCodec import ParamCodec
+    global gs_instance
+    
+    if gs_instance is None or gs_instance.params is None:
+        raise HTTPException(status_code=400, detail="GaussianSplattingが初期化されていません")
+    
+    try:
+        params = ParamCodec.decode(await file.read())
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"パラメータの読み込みに失敗しました: {str(e)}")
+    if params['sigmas'].shape[1] != gs_instance.params['sigmas'].shape[1]:
+        raise HTTPException(status_code=400, detail="共分散の有無が現在の処理方法と一致しません")
+    
+    try:
+        num_gaussians = len(params['weights'])
+        print(f"[ImportParams] 開始: {num_gaussians}個のガウシアンを読み込み")
+        gs_instance.set_params_numpy(params)
+        images = gs_instance.generate_current_images()
+        b64img_pred = ImageManager.cv2_to_base64(images["predicted"])
+        b64img_predpoint = ImageManager.cv2_to_base64(images["points"])
+        print(f"[ImportParams] 完了")
+        return {
+            "status": "imported",
+            "num_gaussians": num_gaussians,
+            "predicted_image": b64img_pred,
+            "points_image": b64img_predpoint
+        }
+        
+    except Exception as e:
+        print(f"[ImportParams] エラー: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"パラメータ読み込みエラー: {str(e)}")
+
 @app.post("/initialize")
 async def initialize_gs(image: UploadFile = File(...),
                         class_name: str = "GaussianSplatting2D",
                         num_gaussians: int = 1000):
     """GaussianSplatting2Dの初期化"""
+    from ImageManager import ImageManager
     global gs_instance
     
     if not image.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="画像ファイルを選択してください")
     
-    class_object = globals().get(class_name)
-    if class_object is None or not isinstance(class_object, type):
-        raise ValueError(f"クラス名 '{class_name}' は見つからないか、クラスではありません。")
+    class_object = _get_class(class_name)
     
     try:
         print(f"[Initialize] 開始: class={class_name}, num_gaussians={num_gaussians}")
         
-        # 画像を読み込み、リサイズ比計算
-        pil_image = ImageManager.open_from_uploadfile(image)
-        org_w, org_h = pil_image.size
-        aspect_ratio = org_w / org_h
+        # 画像を読み込み、高さ250にリサイズ（アスペクト比は保持）
         new_h = 250
-        new_w = int(new_h * aspect_ratio)
+        pil_image = await ImageManager.open_resized_from_uploadfile(image, resize_h=new_h)
+        new_w = pil_image.size[0]
 
         # インスタンス初期化
         if gs_instance is not None:
             del gs_instance
-        gs_instance = class_object()
+        gs_instance = class_object(save_dir=SNAP_SAVE_DIR)
         gs_instance.initialize(pil_image, resize_w=new_w, resize_h=new_h,
                                num_gaussians=num_gaussians)
         initial_images = gs_instance.generate_current_images()
@@ -177,14 +427,13 @@ async def initialize_gs(image: UploadFile = File(...),
 async def reinitialize_gs(class_name: str = "GaussianSplatting2D",
                           num_gaussians: int = 1000):
     """既存の画像でガウシアンパラメータを再初期化"""
+    from ImageManager import ImageManager
     global gs_instance
     
     if gs_instance is None or gs_instance.img_array is None:
         raise HTTPException(status_code=400, detail="画像が読み込まれていません")
     
-    class_object = globals().get(class_name)
-    if class_object is None or not isinstance(class_object, type):
-        raise ValueError(f"クラス名 '{class_name}' は見つからないか、クラスではありません")
+    class_object = _get_class(class_name)
 
     try:
         print(f"[Reinitialize] 開始: class={class_name}, num_gaussians={num_gaussians}")
@@ -192,7 +441,7 @@ async def reinitialize_gs(class_name: str = "GaussianSplatting2D",
         if not isinstance(gs_instance, class_object):
             input_image = gs_instance.img_org
             resize_w, resize_h = input_image.size
-            gs_instance = class_object()
+            gs_instance = class_object(save_dir=SNAP_SAVE_DIR)
             gs_instance.initialize(input_image=input_image,
                                 resize_w=resize_w, resize_h=resize_h, num_gaussians=num_gaussians)
 
@@ -213,12 +462,180 @@ async def reinitialize_gs(class_name: str = "GaussianSplatting2D",
         print(f"[Reinitialize] エラー: {str(e)}")
         raise HTTPException(status_code=500, detail=f"再初期化エラー: {str(e)}")
 
+@app.post("/fit-sequence")
+async def fit_sequence(images: List[UploadFile] = File(...),
+                       class_name: str = "GaussianSplatting2D",
+                       num_gaussians: int = 1000,
+                       learning_rate: float = 0.01,
+                       first_steps: int = 10000,
+                       max_steps: int = 2000,
+                       tol: float = 1e-4,
+                       patience: int = 100,
+                       reuse_optimizer: bool = True):
+    """連続フレームを前フレームの結果からウォームスタートして学習"""
+    from ImageManager import ImageManager
+    from SequenceFitter import SequenceFitter
+    global gs_instance, is_processing
+    
+    if is_processing:
+        raise HTTPException(status_code=409, detail="学習実行中です")
+    for image in images:
+        if not image.content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail="画像ファイルを選択してください")
+    
+    class_object = _get_class(class_name)
+    
+    try:
+        print(f"[FitSequence] 開始: class={class_name}, frames={len(images)}, num_gaussians={num_gaussians}")
+        is_processing = True
+        
+        # 画像を読み込み、高さ250にリサイズ（画像幅は先頭フレーム基準）
+        new_h = 250
+        frames = [await ImageManager.open_resized_from_uploadfile(image, resize_h=new_h)
+                  for image in images]
+        new_w = frames[0].size[0]
+
+        # 最終フレームの結果を現在のインスタンスとする
+        if gs_instance is not None:
+            del gs_instance
+        gs_instance = class_object(save_dir=SNAP_SAVE_DIR)
+        fitter = SequenceFitter(gs_instance, reuse_optimizer=reuse_optimizer)
+        frame_params = await fitter.fit(frames, resize_w=new_w, resize_h=new_h,
+                                        num_gaussians=num_gaussians, opt_lr=learning_rate,
+                                        first_steps=first_steps, max_steps=max_steps,
+                                        tol=tol, patience=patience)
+        container = SequenceFitter.encode(frame_params)
+        print(f"[FitSequence] 完了: steps={fitter.frame_steps}, bytes={len(container)}")
+        
+        return {
+            "status": "fitted",
+            "num_frames": len(frame_params),
+            "num_gaussians": num_gaussians,
+            "steps_per_frame": fitter.frame_steps,
+            "loss_per_frame": fitter.frame_losses,
+            "container": base64.b64encode(container).decode('utf-8')
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[FitSequence] エラー: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"連続フレーム学習エラー: {str(e)}")
+    finally:
+        is_processing = False
+        if gs_instance:
+            gs_instance.should_stop = False
+
+@app.post("/fit-tiled")
+async def fit_tiled(image: UploadFile = File(...),
+                    class_name: str = "GaussianSplatting2D",
+                    tile_size: int = 256,
+                    overlap: int = 32,
+                    gaussians_per_tile: int = 500,
+                    num_steps: int = 2000,
+                    learning_rate: float = 0.01,
+                    max_workers: Optional[int] = None):
+    """大きな画像をタイル分割して並列に学習し、画像全体のガウシアンパラメタを返す"""
+    from ImageManager import ImageManager
+    from TileFitter import TileFitter
+    global is_processing, tile_fitter
+    
+    if is_processing:
+        raise HTTPException(status_code=409, detail="学習実行中です")
+    if not image.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="画像ファイルを選択してください")
+    # クラスはワーカープロセスで読み込むため、ここでは名前だけ確認する
+    if class_name not in GS_CLASS_NAMES:
+        raise HTTPException(status_code=400, detail=f"クラス名 '{class_name}' は見つかりません")
+    
+    try:
+        print(f"[FitTiled] 開始: class={class_name}, tile_size={tile_size}, overlap={overlap}")
+        is_processing = True
+        
+        # 元の解像度のまま使う（PILは遅延デコードのため、画素の展開までスレッド内で行う）
+        pil_image = await asyncio.to_thread(lambda: ImageManager.open_from_uploadfile(image).convert('L'))
+        tile_fitter = TileFitter(class_name=class_name, tile_size=tile_size,
+                                 overlap=overlap, max_workers=max_workers)
+        params = await tile_fitter.fit(pil_image, num_gaussians=gaussians_per_tile,
+                                       num_steps=num_steps, opt_lr=learning_rate)
+        width, height = pil_image.size
+        print(f"[FitTiled] 完了")
+        
+        return {
+            "status": "fitted",
+            "width": width,
+            "height": height,
+            "num_gaussians": len(params['means']),
+            "has_covariance": params['sigmas'].shape[1] == 3,
+            "params": _params_to_list(params)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[FitTiled] エラー: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"タイル分割学習エラー: {str(e)}")
+    finally:
+        is_processing = False
+        tile_fitter = None
+
+async def _pump_progress(websocket: WebSocket, subscriber: ProgressSubscriber):
+    """
+    購読したメッセージをWebSocketへ送信（配信終了か切断まで）
+    websocket: 送信先
+    subscriber: 購読者
+    """
+    try:
+        while (text := await subscriber.get()) is not None:
+            await websocket.send_text(text)
+    except Exception as e:
+        # 切断時の例外はサーバ実装によって異なる（WebSocketDisconnect, ClientDisconnected(OSError)等）
+        print(f"[Watch] WebSocket切断: job={subscriber.channel.job_id} ({type(e).__name__})")
+    finally:
+        subscriber.unsubscribe()
+        # 配信中に最後の購読者がいなくなったら、見る人のいない学習を続けないよう中断する
+        channel = subscriber.channel
+        if not channel.closed and channel.num_subscribers == 0 and channel.job_id == current_job_id:
+            print(f"[Watch] 購読者がいないため学習を中断します: job={channel.job_id}")
+            if gs_instance:
+                gs_instance.should_stop = True
+
+@app.get("/jobs")
+async def get_jobs():
+    """実行中の学習ジョブ一覧を取得"""
+    return {
+        "current_job_id": current_job_id,
+        "jobs": [{"job_id": job_id, "num_subscribers": channel.num_subscribers}
+                 for job_id, channel in jobs.items()]
+    }
+
+@app.websocket("/watch")
+async def websocket_watch(websocket: WebSocket, job_id: Optional[str] = None):
+    """WebSocketで学習経過を購読（job_id未指定なら実行中のジョブ）"""
+    await websocket.accept()
+    channel = jobs.get(job_id or current_job_id)
+    if channel is None:
+        await websocket.send_json({
+            "type": "error",
+            "message": "学習ジョブが見つかりません"
+        })
+        await websocket.close()
+        return
+    
+    await _pump_progress(websocket, channel.subscribe())
+    try:
+        await websocket.close()
+    except RuntimeError:
+        pass
+
 @app.websocket("/train")
 async def websocket_train(websocket: WebSocket):
     """WebSocketで学習実行"""
-    global gs_instance, is_processing, should_stop
+    global gs_instance, is_processing, should_stop, current_job_id
     
     await websocket.accept()
+    channel = None
+    pump_task = None
     try:
         # パラメータ受信
         data = await websocket.receive_text()
@@ -227,6 +644,11 @@ async def websocket_train(websocket: WebSocket):
         num_steps = params.get("num_steps", 10000)
         update_interval = params.get("update_interval", 100)
         loss_function = params.get("loss_function", "_calc_loss_l1_ssim")
+        snap_interval = params.get("snap_interval", 0)
+        snap_format = params.get("snap_format", "video")
+        param_groups = params.get("param_groups")
+        optimizer_impl = params.get("optimizer_impl", "auto")
+        skip_zero_grad = params.get("skip_zero_grad", False)  # 遅延(lazy)更新。結果を変えるだけで高速化はしない
 
         if gs_instance is None:
             await websocket.send_json({
@@ -235,13 +657,28 @@ async def websocket_train(websocket: WebSocket):
             })
             return
         
+        if is_processing:
+            await websocket.send_json({
+                "type": "error",
+                "message": "学習実行中です"
+            })
+            return
+        
         # フラグをリセット
         is_processing = True
         should_stop = False
         if gs_instance:
             gs_instance.should_stop = False
         
-        print(f"[Train] 開始: lr={learning_rate}, steps={num_steps}")
+        # 経過配信チャネルを作成し、このWebSocketも購読者の1つとする
+        job_id = uuid.uuid4().hex[:8]
+        channel = ProgressChannel(job_id)
+        jobs[job_id] = channel
+        current_job_id = job_id
+        pump_task = asyncio.create_task(_pump_progress(websocket, channel.subscribe()))
+        channel.publish({"type": "job", "job_id": job_id}, droppable=False)
+        
+        print(f"[Train] 開始: job={job_id}, lr={learning_rate}, steps={num_steps}")
         
         # 学習実行
         await gs_instance.calculate_async(
@@ -249,29 +686,46 @@ async def websocket_train(websocket: WebSocket):
             opt_lr=learning_rate,
             loss_func_name=loss_function,
             update_interval=update_interval,
-            websocket=websocket
+            channel=channel,
+            snap_interval=snap_interval,
+            snap_format=snap_format,
+            param_groups=param_groups,
+            optimizer_impl=optimizer_impl,
+            skip_zero_grad=skip_zero_grad
         )
         
         print(f"[Train] 完了")
         
-        await websocket.send_json({
+        channel.publish({
             "type": "complete",
             "message": "学習が完了しました"
-        })
+        }, droppable=False)
         
     except WebSocketDisconnect:
         print("[Train] WebSocket切断")
     except Exception as e:
         print(f"[Train] エラー: {str(e)}")
-        await websocket.send_json({
+        message = {
             "type": "error",
             "message": str(e)
-        })
+        }
+        if channel:
+            channel.publish(message, droppable=False)
+        else:
+            await websocket.send_json(message)
     finally:
-        is_processing = False
-        should_stop = False
-        if gs_instance:
-            gs_instance.should_stop = False
+        # 他の処理の実行中に拒否した場合は、その処理のフラグに触れない
+        if channel:
+            is_processing = False
+            should_stop = False
+            if gs_instance:
+                gs_instance.should_stop = False
+            channel.close()
+            jobs.pop(channel.job_id, None)
+            if current_job_id == channel.job_id:
+                current_job_id = None
+        if pump_task:
+            await pump_task
 
 @app.post("/stop")
 async def stop_training():
@@ -280,6 +734,8 @@ async def stop_training():
     should_stop = True
     if gs_instance:
         gs_instance.should_stop = True
+    if tile_fitter:
+        tile_fitter.stop()
     print("[Stop] 学習中断リクエスト")
     return {"status": "stopping"}
 